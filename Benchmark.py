@@ -0,0 +1,158 @@
+# Benchmarks of the solvers and pricing engines on a fixed, seeded corpus of
+# instances, with comparison against a stored baseline
+#
+# python Benchmark.py --sizes small,medium --out bench.json --baseline baseline.json
+
+## Std Lib
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+## Third Party
+import numpy as np
+## Local files
+import GlobalConstants
+import DebugConstants as db
+from Deadline import Deadline
+from MulticastPackingInstance import MulticastPackingInstance, edge_ids
+from RunExpirement import newSolver, runSolver
+from Solvers.MulticastPackingSolver import create_LP
+from ColumnGenerators.Impls.Approx2MulticastPackingColumnGenerator import Approx2MulticastPackingColumnGenerator
+from ColumnGenerators.Impls.ExactMulticastPackingColumnGeneratorIP import ExactMulticastPackingColumnGeneratorIP
+from ColumnGenerators.Impls.ExactMulticastPackingColumnGeneratorSCF import ExactMulticastPackingColumnGeneratorSCF
+
+# label: (Nodes, Edges, Requests, Group Size, Delay, Seed)
+BENCHMARK_CORPUS = {
+    "small": (16, 32, 4, 5, 0, 1),
+    "medium": (40, 120, 8, 8, 0, 2),
+    "large": (120, 480, 16, 12, 0, 3),
+}
+
+PRICING_ENGINES = {
+    "Approx2": Approx2MulticastPackingColumnGenerator,
+    GlobalConstants.MCF_FORMULATION: ExactMulticastPackingColumnGeneratorIP,
+    GlobalConstants.SCF_FORMULATION: ExactMulticastPackingColumnGeneratorSCF,
+}
+
+def benchmarkInstance(label):
+    n,m,k,s,d, seed = BENCHMARK_CORPUS[label]
+    random.seed(seed)
+    np.random.seed(seed)
+    return MulticastPackingInstance(n,m,k,s,d)
+
+def runBenchmark(sizes=BENCHMARK_CORPUS, solverTypes=GlobalConstants.SOLVER_ID_LIST,
+                 approxLevels=GlobalConstants.BLOCK_APPROX_LEVELS, engines=PRICING_ENGINES,
+                 rounds=GlobalConstants.BENCHMARK_PRICING_ROUNDS, max_time=GlobalConstants.MAX_TIME):
+    results = dict(
+        meta=dict(python=platform.python_version(), machine=platform.machine(), max_time=max_time),
+        solvers=dict(),
+        pricing=dict())
+    
+    for label in sizes:
+        instance = benchmarkInstance(label)
+        for apx in approxLevels:
+            for solver_id in solverTypes:
+                if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_0:
+                    print("Benchmark: {} {} {}".format(label, solver_id, apx))
+                random.seed(BENCHMARK_CORPUS[label][-1])
+                start = time.perf_counter()
+                solver = newSolver(solver_id, instance, apx, Deadline(max_time))
+                timer = runSolver(solver)
+                secs = time.perf_counter() - start
+                x = solver.solution[solver.iteration] if solver.iteration >= 0 else None
+                results["solvers"]["{}/{}/{}".format(label, solver_id, apx)] = dict(
+                    secs=secs,
+                    iterations=solver.iteration + 1,
+                    secs_per_iteration=sum(timer)/max(len(timer), 1),
+                    lamb=None if x is None else float(solver.lamb(x)),
+                    lower_bound=float(solver.lower_bound),
+                    gap=None if x is None else float(solver.gap(x)),
+                    stop_flags="{:05b}".format(solver.stop_flag))
+            
+            # Stabilization is judged by the iterations it saves over plain column generation
+            plain = results["solvers"].get("{}/{}/{}".format(label, GlobalConstants.COLGEN_ID, apx))
+            stabilized = results["solvers"].get("{}/{}/{}".format(label, GlobalConstants.STABCG_ID, apx))
+            if plain is not None and stabilized is not None:
+                stabilized["iterations_saved"] = plain["iterations"] - stabilized["iterations"]
+        
+        for engine, generator_class in engines.items():
+            results["pricing"]["{}/{}".format(label, engine)] = benchmarkPricing(
+                instance, generator_class, rounds, BENCHMARK_CORPUS[label][-1])
+    return results
+
+def benchmarkPricing(instance, generator_class, rounds, seed):
+    # Prices every request under the same random prices in each round
+    generator = generator_class(instance, *create_LP(instance.graph, instance.requests))
+    rng = np.random.default_rng(seed)
+    secs = 0
+    cost = 0
+    for r in range(rounds):
+        prices = rng.random(instance.num_edges)
+        for i in range(instance.num_requests):
+            start = time.perf_counter()
+            tree = generator.generate_tree(i, prices)
+            secs += time.perf_counter() - start
+            cost += prices[edge_ids(tree)].sum()
+    return dict(secs_per_tree=secs/(rounds*instance.num_requests), cost=float(cost))
+
+def compareBenchmark(results, baseline,
+                     time_tolerance=GlobalConstants.BENCHMARK_TIME_TOLERANCE,
+                     quality_tolerance=GlobalConstants.BENCHMARK_QUALITY_TOLERANCE):
+    # Regressions of results against baseline, as (case, measure, baseline value, new value)
+    regressions = list()
+    def slower(case, measure, old, new):
+        if new > old*(1 + time_tolerance) and new - old > GlobalConstants.BENCHMARK_MIN_SECS:
+            regressions.append((case, measure, old, new))
+    def worse(case, measure, old, new):
+        if old is not None and (new is None or new > old + quality_tolerance*max(1, abs(old))):
+            regressions.append((case, measure, old, new))
+    
+    for case, new in results["solvers"].items():
+        old = baseline["solvers"].get(case)
+        if old is not None:
+            slower(case, "secs", old["secs"], new["secs"])
+            slower(case, "secs_per_iteration", old["secs_per_iteration"], new["secs_per_iteration"])
+            worse(case, "lamb", old["lamb"], new["lamb"])
+    for case, new in results["pricing"].items():
+        old = baseline["pricing"].get(case)
+        if old is not None:
+            slower(case, "secs_per_tree", old["secs_per_tree"], new["secs_per_tree"])
+            worse(case, "cost", old["cost"], new["cost"])
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the multicast packing solvers")
+    parser.add_argument("--sizes", default=",".join(BENCHMARK_CORPUS))
+    parser.add_argument("--solvers", default=",".join(GlobalConstants.SOLVER_ID_LIST))
+    parser.add_argument("--approx", default=",".join(str(apx) for apx in GlobalConstants.BLOCK_APPROX_LEVELS))
+    parser.add_argument("--engines", default=",".join(PRICING_ENGINES))
+    parser.add_argument("--out", default=None, help="Where to write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="Results to compare against")
+    args = parser.parse_args()
+    
+    db.DEBUG_LEVEL = db.DEBUG_LEVEL_NONE
+    results = runBenchmark(
+        sizes=args.sizes.split(","),
+        solverTypes=args.solvers.split(","),
+        approxLevels=[apx if apx == "Delay" else int(apx) for apx in args.approx.split(",")],
+        engines={engine: PRICING_ENGINES[engine] for engine in args.engines.split(",")})
+    
+    if args.out is None:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.out, 'w') as outFile:
+            json.dump(results, outFile, indent=1)
+        for case, result in results["solvers"].items():
+            if "iterations_saved" in result:
+                print("{}: {} iterations saved over {}".format(
+                    case, result["iterations_saved"], GlobalConstants.COLGEN_ID))
+    
+    if args.baseline is not None:
+        with open(args.baseline) as baselineFile:
+            regressions = compareBenchmark(results, json.load(baselineFile))
+        for case, measure, old, new in regressions:
+            print("REGRESSION {} {}: {} -> {}".format(case, measure, old, new))
+        sys.exit(1 if regressions else 0)
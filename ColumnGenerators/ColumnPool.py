@@ -0,0 +1,171 @@
+# Pool of tree columns together with their sparse tree-edge incidence matrix
+
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+
+import GlobalConstants
+from MulticastPackingInstance import edge_ids
+
+class ColumnPool:
+    def __init__(self, instance):
+        self.instance = instance
+        self.trees = list()
+        self.variables = list()
+        self.signatures = list()
+        self.column_of = dict()
+        self.column_index = dict()
+
+        # A column is removed once it has been non-basic with reduced cost above
+        # age_redcost for age_limit consecutive solves (0 disables aging)
+        self.age_limit = GlobalConstants.COLUMN_AGE_LIMIT
+        self.age_redcost = GlobalConstants.COLUMN_AGE_REDCOST
+
+        # Growable CSR buffers (columns x edges); capacity doubles when full
+        self.num_columns = 0
+        self.nnz = 0
+        self._request_ids = np.zeros(16, dtype=np.intp)
+        self._ages = np.zeros(16, dtype=np.intp)
+        self._indptr = np.zeros(17, dtype=np.intp)
+        self._indices = np.zeros(16*max(self.instance.num_requests, 1), dtype=np.intp)
+        self._data = np.ones(len(self._indices))
+        self._incidence = None
+
+    def __len__(self):
+        return self.num_columns
+
+    def find(self, i, ids):
+        # Column of request i with exactly the edges in ids, if there is one
+        return self.column_index.get(signature(i, ids))
+
+    def add(self, i, tree, var=None, ids=None):
+        if ids is None:
+            ids = edge_ids(tree)
+        col = self.num_columns
+
+        if col + 1 >= len(self._request_ids):
+            self._request_ids = grow(self._request_ids, 2*len(self._request_ids))
+            self._ages = grow(self._ages, 2*len(self._ages))
+            self._indptr = grow(self._indptr, 2*len(self._indptr))
+        if self.nnz + len(ids) > len(self._indices):
+            capacity = max(2*len(self._indices), self.nnz + len(ids))
+            self._indices = grow(self._indices, capacity)
+            self._data = np.ones(capacity)
+
+        self._indices[self.nnz:self.nnz + len(ids)] = ids
+        self.nnz += len(ids)
+        self._indptr[col + 1] = self.nnz
+        self._request_ids[col] = i
+        self._ages[col] = 0
+        self.num_columns += 1
+        self._incidence = None
+
+        self.trees.append(tree)
+        self.variables.append(var)
+        self.signatures.append(signature(i, ids))
+        self.column_of[tree] = col
+        self.column_index[self.signatures[col]] = col
+        return col
+
+    def remove(self, cols):
+        keep = np.ones(self.num_columns, dtype=bool)
+        keep[cols] = False
+        lengths = np.diff(self._indptr[:self.num_columns + 1])
+
+        indices = self._indices[:self.nnz][np.repeat(keep, lengths)]
+        self.nnz = len(indices)
+        self._indices[:self.nnz] = indices
+        self.num_columns = int(keep.sum())
+        self._indptr[1:self.num_columns + 1] = np.cumsum(lengths[keep])
+        self._request_ids[:self.num_columns] = self._request_ids[:len(keep)][keep]
+        self._ages[:self.num_columns] = self._ages[:len(keep)][keep]
+        self._incidence = None
+
+        self.trees = [T for T, kept in zip(self.trees, keep) if kept]
+        self.variables = [var for var, kept in zip(self.variables, keep) if kept]
+        self.signatures = [sig for sig, kept in zip(self.signatures, keep) if kept]
+        self.column_of = {T: col for col, T in enumerate(self.trees)}
+        self.column_index = {sig: col for col, sig in enumerate(self.signatures)}
+
+    def age(self, reduced_LP):
+        # Update ages from the last solve of reduced_LP and return the columns
+        # that have reached the age limit
+        if not self.age_limit or reduced_LP.IsMIP or self.num_columns == 0:
+            return np.zeros(0, dtype=np.intp)
+        vbasis = np.array(reduced_LP.getAttr(gp.GRB.Attr.VBasis, self.variables))
+        rc = np.array(reduced_LP.getAttr(gp.GRB.Attr.RC, self.variables))
+        stale = (vbasis != gp.GRB.BASIC) & (rc > self.age_redcost)
+
+        ages = self._ages[:self.num_columns]
+        ages[stale] += 1
+        ages[~stale] = 0
+        return np.flatnonzero(ages >= self.age_limit)
+
+    def cheapest_columns(self, prices):
+        # Column of each request with the least cost; -1 for requests without columns
+        costs = self.costs(prices)
+        request_ids = self.request_ids()
+        order = np.lexsort((costs, request_ids))
+        first = np.flatnonzero(np.diff(request_ids[order], prepend=-1) != 0)
+        retval = np.full(self.instance.num_requests, -1, dtype=np.intp)
+        retval[request_ids[order[first]]] = order[first]
+        return retval
+
+    def column_edges(self, col):
+        return self._indices[self._indptr[col]:self._indptr[col + 1]]
+
+    def request_ids(self):
+        return self._request_ids[:self.num_columns]
+
+    def incidence(self):
+        # The matrix is a view onto the buffers, so building it copies nothing
+        if self._incidence is None:
+            self._incidence = sp.csr_matrix(
+                (self._data[:self.nnz], self._indices[:self.nnz], self._indptr[:self.num_columns + 1]),
+                shape=(self.num_columns, self.instance.num_edges))
+        return self._incidence
+
+    def costs(self, prices):
+        # Cost of every column under an edge-id indexed price vector
+        return self.incidence() @ prices
+
+    def min_costs(self, prices):
+        # Cheapest column of each request; inf for requests without columns
+        retval = np.full(self.instance.num_requests, np.inf)
+        np.minimum.at(retval, self.request_ids(), self.costs(prices))
+        return retval
+
+    def state(self):
+        # Arrays that, together with restore, let another pool carry on from this one
+        return dict(
+            column_requests=self.request_ids().copy(),
+            column_ages=self._ages[:self.num_columns].copy(),
+            column_indptr=self._indptr[:self.num_columns + 1].copy(),
+            column_indices=self._indices[:self.nnz].copy())
+
+    def restore(self, state, add_column, edge_map=None):
+        # Adds the columns of state that are not pooled yet through
+        # add_column(i, ids), which must add them to this pool, and returns the
+        # pool column of each. edge_map, if given, takes the edge ids of state
+        # to those of this pool's instance.
+        indptr, indices = state["column_indptr"], state["column_indices"]
+        if edge_map is not None:
+            indices = edge_map[indices]
+        columns = np.zeros(len(state["column_requests"]), dtype=np.intp)
+        for col, i in enumerate(state["column_requests"].tolist()):
+            ids = indices[indptr[col]:indptr[col + 1]]
+            if self.find(i, ids) is None:
+                add_column(i, ids)
+            columns[col] = self.find(i, ids)
+        self._ages[columns] = state["column_ages"]
+        return columns
+
+# Helper Functions
+def signature(i, ids):
+    # Canonical key of a column: its request and its sorted edge ids
+    return (i, np.sort(ids).tobytes())
+
+def grow(array, capacity):
+    retval = np.zeros(capacity, dtype=array.dtype)
+    retval[:len(array)] = array
+    return retval
@@ -0,0 +1,41 @@
+# Structure shared by the exact pricing models of an instance, and a cache of those models
+
+import weakref
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+# Built once per instance, so every solver and approximation level on an
+# instance reuses the same template and models
+_templates = weakref.WeakKeyDictionary()
+
+class ExactPricingModels:
+    @classmethod
+    def for_instance(cls, instance):
+        if instance not in _templates:
+            _templates[instance] = cls(instance)
+        return _templates[instance]
+
+    def __init__(self, instance):
+        # Nothing here may refer back to the instance, or it would never be freed
+        D = nx.DiGraph(instance.graph)
+        self.nodes = list(D.nodes())
+        self.node_index = {v: k for k, v in enumerate(self.nodes)}
+        self.arcs = list(D.edges())
+        self.arc_index = {a: k for k, a in enumerate(self.arcs)}
+        self.arc_edge = np.array([instance.edge_index[a] for a in self.arcs], dtype=np.intp)
+        n, A = len(self.nodes), len(self.arcs)
+
+        # Node-arc incidences; conservation gives inflow - outflow at each node
+        tails = np.array([self.node_index[u] for u, v in self.arcs], dtype=np.intp)
+        heads = np.array([self.node_index[v] for u, v in self.arcs], dtype=np.intp)
+        self.head_incidence = sp.csr_matrix((np.ones(A), (heads, np.arange(A))), shape=(n, A))
+        self.tail_incidence = sp.csr_matrix((np.ones(A), (tails, np.arange(A))), shape=(n, A))
+        self.conservation = (self.head_incidence - self.tail_incidence).tocsr()
+        # Both arcs of each edge
+        self.edge_arcs = sp.csr_matrix((np.ones(A), (self.arc_edge, np.arange(A))),
+                                       shape=(instance.num_edges, A))
+
+        # (generator class, request, workers) -> (model, arc selection variables)
+        self.models = dict()
@@ -1,16 +1,18 @@
 # 2-Approximation for Column Generation
 
-import networkx as nx
-from networkx.algorithms.approximation.steinertree import steiner_tree as steiner_tree_2
 from ColumnGenerators.MulticastPackingColumnGenerator import MulticastPackingColumnGenerator
+from ColumnGenerators.MehlhornSteinerEngine import MehlhornSteinerEngine
 
 class Approx2MulticastPackingColumnGenerator(MulticastPackingColumnGenerator):
-    def generate_tree(self, i, prices):
-        G = self.instance.graph
-        original_weights = nx.get_edge_attributes(G, "weight") 
-        nx.set_edge_attributes(G, prices, "weight")
-        assert not nx.is_negatively_weighted(G, weight='weight'), print(prices)
-        retval = nx.algorithms.approximation.steinertree.steiner_tree(
-            G, self.instance.requests[i].multicast_group())
-        nx.set_edge_attributes(G, original_weights, "weight")
-        return retval
\ No newline at end of file
+    # The engine reads the prices directly and never touches the graph
+    thread_safe = True
+    approximation_ratio = 2
+    
+    def __init__(self, instance, reduced_LP, congestion_constrs, selection_constrs):
+        super().__init__(instance, reduced_LP, congestion_constrs, selection_constrs)
+        self.engine = MehlhornSteinerEngine.for_instance(instance)
+        
+    def generate_tree(self, i, prices, target=None):
+        assert (prices >= 0).all(), print(prices)
+        tree = self.engine.steiner_tree(self.instance.requests[i].multicast_group(), prices)
+        return self.instance.graph.edge_subgraph(self.instance.edges[e_id] for e_id in tree)
@@ -1,25 +1,28 @@
 # MCF IP with Delay Constraints for Column Generation
 
 import gurobipy as gp
-import networkx as nx
+import numpy as np
+import scipy.sparse as sp
 from ColumnGenerators.Impls.ExactMulticastPackingColumnGeneratorIP import ExactMulticastPackingColumnGeneratorIP
 
 class ExactMcpWithDelayColumnGenerator(ExactMulticastPackingColumnGeneratorIP):
-    def __init__(self, instance, reduced_LP):
-        super().__init__(instance, reduced_LP)
-        D = nx.DiGraph(instance.graph)
-        max_delay = instance.delay
-        for i in range(instance.num_requests):
-            model = self.GurobiModels[i]
-            f = self.variables[i][1]
-            
-            # Add constraints
-            for r in instance.requests[i].recipients:
-                model.addConstr(
-                    sum(D[u][v]['delay']*f[r][(u,v)] for u,v in D.edges()) <= max_delay,
-                    name="Delay constraint for {}-flow".format(r)
-                )
-            
-            # Note we don't add the objective as that is determined by
-            # the prices in each iteration.
-            model.update()
\ No newline at end of file
+    def __init__(self, instance, reduced_LP, congestion_constrs, selection_constrs):
+        super().__init__(instance, reduced_LP, congestion_constrs, selection_constrs)
+        G = instance.graph
+        self.arc_delay = np.array([G[u][v]['delay'] for u, v in self.arcs], dtype=np.float64)
+
+    def build_model(self, i):
+        model, z = super().build_model(i)
+        A = len(self.arcs)
+        R = len(self.instance.requests[i].recipients)
+        max_delay = self.instance.delay
+
+        # Add constraints: the flow to each recipient may only use a path
+        # within the delay bound
+        model.addMConstr(
+            sp.hstack([sp.csr_matrix((R, A)), sp.kron(sp.eye(R), self.arc_delay[np.newaxis, :])]).tocsr(),
+            z, gp.GRB.LESS_EQUAL, np.full(R, max_delay))
+
+        # Note we don't add the objective as that is determined by
+        # the prices in each iteration.
+        return model, z
@@ -2,86 +2,144 @@
 
 import gurobipy as gp
 import networkx as nx
-from networkx.algorithms.approximation.steinertree import steiner_tree as steiner_tree_2
+import numpy as np
+import scipy.sparse as sp
+
+import GlobalConstants
 from ColumnGenerators.MulticastPackingColumnGenerator import MulticastPackingColumnGenerator
+from ColumnGenerators.MehlhornSteinerEngine import MehlhornSteinerEngine
+from ColumnGenerators.ExactPricingModels import ExactPricingModels
+from GurobiEnv import shared_env, worker_envs
 
 class ExactMulticastPackingColumnGeneratorIP(MulticastPackingColumnGenerator):
-    def __init__(self, instance, reduced_LP):
-        super().__init__(instance, reduced_LP)
-        self.GurobiModels = list()
-        self.variables = list()
-        D = nx.DiGraph(instance.graph)
-        for i in range(instance.num_requests):
-            source = instance.requests[i].source
-            recipients = instance.requests[i].recipients
-            
-            model = gp.Model("Steiner Tree IP (MCF) for Request {}".format(i))
-            # Add variables
-            x = {e : model.addVar(vtype=gp.GRB.BINARY, 
-                                  name="{} selection".format(e)) 
-                     for e in D.edges()}
-            f = {r : {e: model.addVar(vtype=gp.GRB.BINARY, 
-                                      name="{} flow to {}".format(e,r)) 
-                          for e in D.edges()} 
-                     for r in recipients}
-            
-            # Add constraints
-            for r in recipients:
-                for v in D.nodes():
-                    inflow = sum(f[r][(u,v)] for u in D.predecessors(v))
-                    outflow = sum(f[r][(v,w)] for w in D.successors(v))
-                    if v == source:
-                        netflow = -1
-                    elif v == r:
-                        netflow = 1
-                    else:
-                        netflow = 0
-                    
-                    model.addConstr(inflow - outflow == netflow,
-                                    name="{}-flow conservation for {}".format(r,v))
-                
-                for e in D.edges():
-                    model.addConstr(f[r][e] <= x[e],
-                                    name="{} availability for {}-flow".format(e,r))
-            
-            # Note we don't add the objective as that is determined by
-            # the prices in each iteration.
+    # Each request has its own model, and models solved at once never share an environment
+    thread_safe = True
+
+    def __init__(self, instance, reduced_LP, congestion_constrs, selection_constrs):
+        super().__init__(instance, reduced_LP, congestion_constrs, selection_constrs)
+        # Models are built from the instance's shared template the first time a
+        # request is priced, and are shared with every other generator of the
+        # same kind on the instance
+        self.template = ExactPricingModels.for_instance(instance)
+
+        # Both arcs of an edge share its price, so prices reach the arcs through arc_edge
+        self.arcs = self.template.arcs
+        self.arc_edge = self.template.arc_edge
+        self.arc_index = self.template.arc_index
+
+        self.mip_start = GlobalConstants.EXACT_PRICING_MIP_START
+        self.early_stop = GlobalConstants.EXACT_PRICING_EARLY_STOP
+        self.engine = MehlhornSteinerEngine.for_instance(instance)
+        self.start_columns = None
+
+        # Requests are priced in blocks of num_workers consecutive requests, so
+        # request i uses environment i % num_workers. A single worker uses the
+        # process's shared environment.
+        self.envs = worker_envs(self.num_workers) if self.num_workers > 1 else list()
+
+    def model_for(self, i):
+        # The model of request i and its arc selection variables, built on first use
+        key = (type(self), i, self.num_workers)
+        if key not in self.template.models:
+            model, z = self.build_model(i)
+
+            # Note we don't add the objective coefficients as they are
+            # determined by the prices in each iteration.
+            model.ModelSense = gp.GRB.MINIMIZE
             model.update()
-            
-            self.variables.append((x,f))
-            self.GurobiModels.append(model)
-    
-    
-    def generate_tree(self, i, prices):
-        model = self.GurobiModels[i]
-        x = self.variables[i][0]
-        c = dict()
-        
-        if isinstance(prices, dict):
-            for e in x:
-                if e in prices:
-                    c[e] = prices[e]
-                elif tuple(reversed(e)) in prices:
-                    c[e] = prices[tuple(reversed(e))]
-                else:
-                    raise KeyError('Edge not in prices?!')
-        else: # should be a constant numeric value
-            for e in x:
-                c[e] = prices
-                    
-        
-        model.setObjective(sum(c[e]*x[e] for e in x), gp.GRB.MINIMIZE)
-        model.update()
+            self.template.models[key] = (model, z[:len(self.arcs)].tolist())
+        return self.template.models[key]
+
+    def new_model(self, i, name):
+        return gp.Model(name, env=self.envs[i % self.num_workers] if self.envs else shared_env())
+
+    def build_model(self, i):
+        # Returns the model of request i and its variable vector, which starts
+        # with one selection variable per arc
+        T = self.template
+        n, A = len(T.nodes), len(T.arcs)
+        source = T.node_index[self.instance.requests[i].source]
+        recipients = [T.node_index[r] for r in self.instance.requests[i].recipients]
+        R = len(recipients)
+
+        model = self.new_model(i, "Steiner Tree IP (MCF) for Request {}".format(i))
+        # The arc selections, then a block of flow variables for each recipient
+        z = model.addMVar((R + 1)*A, vtype=gp.GRB.BINARY, name="z")
+
+        # Flow conservation for each recipient's commodity
+        netflow = np.zeros((R, n))
+        netflow[:, source] = -1
+        netflow[np.arange(R), recipients] = 1
+        model.addMConstr(
+            sp.hstack([sp.csr_matrix((R*n, A)), sp.kron(sp.eye(R), T.conservation)]).tocsr(),
+            z, gp.GRB.EQUAL, netflow.ravel())
+
+        # Flow may only use selected arcs
+        model.addMConstr(
+            sp.hstack([-sp.vstack([sp.eye(A)]*R), sp.eye(R*A)]).tocsr(),
+            z, gp.GRB.LESS_EQUAL, np.zeros(R*A))
+
+        return model, z
+
+    def prepare_round(self, prices):
+        # The cheapest pooled tree of each request is a candidate MIP start
+        if self.mip_start and len(self.column_pool):
+            self.start_columns = self.column_pool.cheapest_columns(prices)
+        else:
+            self.start_columns = None
+
+    def start_tree(self, i, prices):
+        # Edge ids of the cheaper of the 2-approximation and the best pooled tree
+        tree = self.engine.steiner_tree(self.instance.requests[i].multicast_group(), prices)
+        if self.start_columns is not None and self.start_columns[i] >= 0:
+            pooled = self.column_pool.column_edges(self.start_columns[i])
+            if prices[pooled].sum() < prices[tree].sum():
+                tree = pooled
+        return tree
+
+    def set_start(self, i, tree):
+        # Orient the tree away from the source and give its arcs as the MIP start
+        model, arc_variables = self.model_for(i)
+        source = self.instance.requests[i].source
+        start = np.zeros(len(self.arcs))
+        T = self.instance.graph.edge_subgraph(self.instance.edges[e_id] for e_id in tree)
+        if source in T:
+            for u, v in nx.bfs_edges(T, source):
+                start[self.arc_index[(u, v)]] = 1
+        model.setAttr(gp.GRB.Attr.Start, arc_variables, start.tolist())
+
+    def generate_tree(self, i, prices, target=None):
+        model, arc_variables = self.model_for(i)
+
+        # Only the objective coefficients change between calls
+        model.setAttr(gp.GRB.Attr.Obj, arc_variables, prices[self.arc_edge].tolist())
+        if self.mip_start:
+            self.set_start(i, self.start_tree(i, prices))
+        # Any tree with negative reduced cost ends the solve; optimality is only
+        # proved when there is none
+        if self.early_stop and target is not None:
+            model.Params.BestObjStop = target - 1e-9
+        else:
+            model.Params.BestObjStop = -gp.GRB.INFINITY
+        self.deadline.limit(model)
         model.optimize()
         status = model.getAttr(gp.GRB.Attr.Status)
-        if status != gp.GRB.OPTIMAL:
+        with self.counter_lock:
+            self.num_solves += 1
+            if status == gp.GRB.USER_OBJ_LIMIT:
+                self.num_early_stops += 1
+        if status == gp.GRB.TIME_LIMIT:
+            # Out of time; the incumbent, if any, is still a tree
+            if model.SolCount == 0:
+                return None
+        elif status not in (gp.GRB.OPTIMAL, gp.GRB.USER_OBJ_LIMIT):
             print("Column Gen Error")
             print("{} exited with code {}".format(model, status))
             return self.instance.graph.edge_subgraph()
-        
-        steinerTree = list()
-        for e in self.instance.graph.edges():
-            if (x[e].X == 1) or (x[tuple(reversed(e))].X == 1):
-                steinerTree.append(e)
-        
-        return self.instance.graph.edge_subgraph(steinerTree)
\ No newline at end of file
+
+        # The solve proves a bound on the cheapest tree even when it stops early
+        self.cost_bounds[i] = max(model.ObjBound, 0)
+        selected = np.array(model.getAttr(gp.GRB.Attr.X, arc_variables)) > 0.5
+        steinerTree = np.unique(self.arc_edge[selected])
+
+        return self.instance.graph.edge_subgraph(self.instance.edges[e_id] for e_id in steinerTree)
@@ -0,0 +1,95 @@
+# Mehlhorn's 2-Approximation for Steiner Tree over a CSR adjacency of an instance
+
+import weakref
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra, minimum_spanning_tree
+
+# Engines are built once per instance and shared by every generator using it
+_engines = weakref.WeakKeyDictionary()
+
+class MehlhornSteinerEngine:
+    @classmethod
+    def for_instance(cls, instance):
+        if instance not in _engines:
+            _engines[instance] = cls(instance)
+        return _engines[instance]
+
+    def __init__(self, instance):
+        # Nothing here may refer back to the instance, or it would never be freed
+        self.edge_index = instance.edge_index
+        self.nodes = list(instance.graph.nodes())
+        self.node_index = {v: k for k, v in enumerate(self.nodes)}
+        n = len(self.nodes)
+        m = instance.num_edges
+
+        # Endpoints of each edge, by edge id
+        self.eu = np.array([self.node_index[u] for u, v in instance.edges], dtype=np.intp)
+        self.ev = np.array([self.node_index[v] for u, v in instance.edges], dtype=np.intp)
+
+        # Both arcs of every edge, sorted by tail; entry_edge maps entries to edge ids
+        rows = np.concatenate([self.eu, self.ev])
+        cols = np.concatenate([self.ev, self.eu])
+        order = np.lexsort((cols, rows))
+        self.indices = cols[order]
+        self.entry_edge = np.concatenate([np.arange(m), np.arange(m)])[order]
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n))))
+
+    def steiner_tree(self, terminals, prices):
+        # Edge ids of a tree spanning terminals, at most twice the cost of an optimal one
+        n = len(self.nodes)
+        terminals = np.array([self.node_index[v] for v in terminals], dtype=np.intp)
+        if len(terminals) < 2:
+            return np.zeros(0, dtype=np.intp)
+
+        # Voronoi regions of the terminals from one multi-source Dijkstra
+        adjacency = sp.csr_matrix((prices[self.entry_edge], self.indices, self.indptr), shape=(n, n))
+        dist, pred, _ = dijkstra(adjacency, indices=terminals, min_only=True, return_predecessors=True)
+        pred[terminals] = -9999
+        dist[terminals] = 0
+
+        # With zero prices several terminals can tie, so take the region of each
+        # node to be the root of its predecessor chain
+        root = np.where(pred < 0, np.arange(n), pred)
+        while True:
+            next_root = root[root]
+            if np.array_equal(next_root, root):
+                break
+            root = next_root
+
+        # Cheapest edge bridging each pair of neighbouring regions
+        su, sv = root[self.eu], root[self.ev]
+        bridges = np.flatnonzero(su != sv)
+        weights = dist[self.eu[bridges]] + prices[bridges] + dist[self.ev[bridges]]
+        keys = np.minimum(su[bridges], sv[bridges])*n + np.maximum(su[bridges], sv[bridges])
+        order = np.lexsort((weights, keys))
+        first = order[np.diff(keys[order], prepend=-1) != 0]
+        bridges, weights, keys = bridges[first], weights[first], keys[first]
+
+        # MST of the terminals under the bridge weights. scipy treats zero weights
+        # as missing edges, so these are raised to the smallest positive float
+        position = np.full(n, -1, dtype=np.intp)
+        position[terminals] = np.arange(len(terminals))
+        terminal_graph = sp.csr_matrix(
+            (np.maximum(weights, np.finfo(np.float64).tiny),
+             (position[keys // n], position[keys % n])),
+            shape=(len(terminals), len(terminals)))
+        mst = minimum_spanning_tree(terminal_graph).tocoo()
+        a, b = terminals[mst.row], terminals[mst.col]
+        chosen = bridges[np.searchsorted(keys, np.minimum(a, b)*n + np.maximum(a, b))]
+
+        # Expand each bridge into the shortest paths back to its two terminals.
+        # These paths lie in the shortest path trees of the regions, so together
+        # with the bridges they already form a tree whose leaves are terminals
+        tree = list(chosen)
+        visited = np.zeros(n, dtype=bool)
+        edge_index = self.edge_index
+        nodes = self.nodes
+        for e_id in chosen:
+            for u in (self.eu[e_id], self.ev[e_id]):
+                while not visited[u] and pred[u] >= 0:
+                    visited[u] = True
+                    tree.append(edge_index[(nodes[u], nodes[pred[u]])])
+                    u = pred[u]
+        return np.array(tree, dtype=np.intp)
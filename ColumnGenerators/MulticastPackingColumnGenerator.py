@@ -1,44 +1,197 @@
 # Abstract Column Generator
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 import gurobipy as gp
 import networkx as nx
+import numpy as np
+
+import GlobalConstants
+from Deadline import Deadline
+from Telemetry import Telemetry
+from MulticastPackingInstance import edge_ids
+from ColumnGenerators.ColumnPool import ColumnPool
 
 class MulticastPackingColumnGenerator(ABC):
-    def __init__(self, instance, reduced_LP):
+    # Whether generate_tree may run for several requests at once
+    thread_safe = False
+    # Factor by which a tree from generate_tree may cost more than the cheapest
+    approximation_ratio = 1
+    
+    def __init__(self, instance, reduced_LP, congestion_constrs, selection_constrs):
         self.instance = instance
         self.reduced_LP = reduced_LP
+        self.congestion_constrs = congestion_constrs
+        self.selection_constrs = selection_constrs
         self.varType = gp.GRB.CONTINUOUS
         self.Gurobi_variables = [dict() for i in range(self.instance.num_requests)]
+        self.column_pool = ColumnPool(instance)
+        # Improving columns after which a filtered pricing round ends (0 prices every request)
+        self.partial_pricing_limit = GlobalConstants.PARTIAL_PRICING_LIMIT
+        self.next_request = 0
+        # Requests are priced in blocks of num_workers consecutive requests
+        self.num_workers = max(1, GlobalConstants.PRICING_WORKERS)
+        # Pricing problems solved, and how many of them stopped before proving optimality
+        self.num_solves = 0
+        self.num_early_stops = 0
+        self.counter_lock = threading.Lock()
+        self.deadline = Deadline()
+        self.telemetry = Telemetry()
+        # Trees of the last pricing round, how many of them use each edge, and
+        # how many columns it added
+        self.new_trees = None
+        self.new_tree_load = None
+        self.columns_added = 0
+        # Whether the last round found the cheapest tree of every request, so
+        # neither skipped requests nor stopped any solve early. Trees of a round
+        # that was not complete are no evidence of optimality.
+        self.round_complete = False
+        # Lower bounds on the cheapest tree of each request under the prices of
+        # the last round, which generate_tree may set itself, and the Lagrangian
+        # bound on lambda they give (nan if some request went unpriced)
+        self.cost_bounds = np.zeros(self.instance.num_requests)
+        self.round_bound = np.nan
+        
+    def take_columns(self, other):
+        # Adopt the columns generated so far by another generator on the same LP
+        self.varType = other.varType
+        self.Gurobi_variables = other.Gurobi_variables
+        self.column_pool = other.column_pool
+        self.new_trees = other.new_trees
+        self.new_tree_load = other.new_tree_load
+        self.round_complete = other.round_complete
+        self.deadline = other.deadline
+        self.telemetry = other.telemetry
         
     @abstractmethod
-    def generate_tree(self, i, prices):
+    def generate_tree(self, i, prices, target=None):
+        # If target is given, any tree cheaper than target will do. None means
+        # the deadline passed before any tree was found.
         pass
     
-    def generate_new_trees(self, prices=1):
-        new_trees = list()
+    def prepare_round(self, prices):
+        # Called before each pricing round
+        pass
+    
+    def generate_new_trees(self, prices=1, duals=None, q=None):
+        # If duals and q are given, only trees whose cost under the duals is below
+        # q_i are added to the reduced LP, and the round may end early
+        num_requests = self.instance.num_requests
+        new_trees = [None] * num_requests
+        new_ids = [None] * num_requests
         assert nx.is_weighted(self.instance.graph)
-        for i in range(self.instance.num_requests):
-            new_tree = self.generate_tree(i, prices)
-            new_trees.append(new_tree)
-            
-            coeffs = list()
-            constrs = list()
-            # the new tree contributes to the constraint for each of its edges
-            for e in new_tree.edges():
-                coeffs.append(-1)
-                constrs.append(self.reduced_LP.getConstrByName(
-                    "{} congestion".format(sorted(e))))
-            
-            # the new tree contributes to the selection constraint 
-            # for the corresponding multicast request
-            coeffs.append(1)
-            constrs.append(self.reduced_LP.getConstrByName(
-                "Tree Selection for {}".format(i)))
-            self.Gurobi_variables[i][new_tree] = self.reduced_LP.addVar(
-                name="x({}, {})".format(i, nx.info(new_tree)), 
-                column=gp.Column(coeffs, constrs),
-                vtype=self.varType)
-            self.reduced_LP.update()
+        # Prices are an edge-id indexed array; a scalar means uniform prices
+        if np.isscalar(prices):
+            prices = np.full(self.instance.num_edges, prices, dtype=np.float64)
+        filtered = duals is not None
+        # When pricing under the duals themselves, q_i is the cost to beat
+        targets = q if filtered and np.array_equal(duals, prices) else [None] * num_requests
+        self.cost_bounds = np.full(num_requests, np.nan)
+        early_stops = self.num_early_stops
+        self.prepare_round(prices)
+        generate_tree = self.generate_tree
+        if self.telemetry.enabled:
+            generate_tree = self.timed_generate_tree
+            self.telemetry.record.setdefault("request_pricing_secs", [0.0] * num_requests)
+        
+        # Partial pricing starts at the block where the previous round stopped
+        workers = self.num_workers if self.thread_safe else 1
+        blocks = [range(s, min(s + workers, num_requests)) for s in range(0, num_requests, workers)]
+        start = (self.next_request // workers) % len(blocks) if filtered else 0
+        blocks = blocks[start:] + blocks[:start]
+        num_improving = 0
+        executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        for block in blocks:
+            if filtered and self.partial_pricing_limit and num_improving >= self.partial_pricing_limit:
+                self.next_request = block[0]
+                break
+            if self.deadline.expired():
+                break
+            if executor is None:
+                block_trees = [generate_tree(i, prices, targets[i]) for i in block]
+            else:
+                block_trees = list(executor.map(lambda i: generate_tree(i, prices, targets[i]), block))
             
-        return new_trees
\ No newline at end of file
+            # Columns are added in request order, whatever order the solves finish in
+            for i, new_tree in zip(block, block_trees):
+                if new_tree is None:
+                    continue
+                ids = edge_ids(new_tree)
+                new_ids[i] = ids
+                if np.isnan(self.cost_bounds[i]):
+                    self.cost_bounds[i] = prices[ids].sum() / self.approximation_ratio
+                
+                # A tree already in the pool is not added again as a duplicate column
+                col = self.column_pool.find(i, ids)
+                if col is not None:
+                    new_trees[i] = self.column_pool.trees[col]
+                    continue
+                new_trees[i] = new_tree
+                
+                if filtered and duals[ids].sum() >= q[i]:
+                    continue
+                num_improving += 1
+                self.add_column(i, new_tree, ids)
+        if executor is not None:
+            executor.shutdown()
+        
+        # Requests left unpriced by partial pricing or the deadline get their
+        # cheapest pooled tree, if they have one yet
+        self.round_complete = all(T is not None for T in new_trees)
+        if not self.round_complete:
+            cheapest = self.column_pool.cheapest_columns(prices)
+            for i in range(num_requests):
+                if new_trees[i] is None and cheapest[i] >= 0:
+                    new_trees[i] = self.column_pool.trees[cheapest[i]]
+                    new_ids[i] = self.column_pool.column_edges(cheapest[i])
+        
+        # The columns of the whole round are added to the LP in one update
+        self.reduced_LP.update()
+        self.new_trees = new_trees
+        self.new_tree_load = np.bincount(np.concatenate([ids for ids in new_ids if ids is not None]
+                                                        + [np.empty(0, dtype=np.intp)]), minlength=self.instance.num_edges).astype(np.float64)
+        self.columns_added = num_improving
+        self.round_complete = self.round_complete and self.num_early_stops == early_stops
+        # Every solution of the reduced LP loads some edges by at least the
+        # price-weighted average of its trees' costs
+        self.round_bound = self.cost_bounds.sum() / prices.sum() if prices.sum() > 0 else np.nan
+        if self.telemetry.enabled:
+            self.telemetry.update(columns=len(self.column_pool),
+                                  columns_added=num_improving,
+                                  pricing_solves=self.num_solves,
+                                  pricing_early_stops=self.num_early_stops)
+        return new_trees
+    
+    def timed_generate_tree(self, i, prices, target=None):
+        start = time.perf_counter()
+        tree = self.generate_tree(i, prices, target)
+        self.telemetry.record["request_pricing_secs"][i] += time.perf_counter() - start
+        return tree
+    
+    def add_column(self, i, tree, ids):
+        # the new tree contributes to the constraint for each of its edges
+        constrs = [self.congestion_constrs[e_id] for e_id in ids]
+        coeffs = [-1] * len(constrs)
+        
+        # the new tree contributes to the selection constraint 
+        # for the corresponding multicast request
+        coeffs.append(1)
+        constrs.append(self.selection_constrs[i])
+        self.Gurobi_variables[i][tree] = self.reduced_LP.addVar(
+            name="x({}, {})".format(i, nx.info(tree)), 
+            column=gp.Column(coeffs, constrs),
+            vtype=self.varType)
+        self.column_pool.add(i, tree, self.Gurobi_variables[i][tree], ids)
+    
+    def age_columns(self):
+        # Remove the columns that have aged out of the pool from the reduced LP
+        pool = self.column_pool
+        stale = pool.age(self.reduced_LP)
+        if len(stale):
+            request_ids = pool.request_ids()
+            for col in stale:
+                self.reduced_LP.remove(pool.variables[col])
+                del self.Gurobi_variables[request_ids[col]][pool.trees[col]]
+            pool.remove(stale)
\ No newline at end of file
@@ -0,0 +1,22 @@
+# Wall-clock budget shared by a solver, its column generator and their Gurobi solves
+
+import time
+
+import gurobipy as gp
+
+class Deadline:
+    def __init__(self, seconds=None):
+        # No seconds means no limit
+        self.end = None if seconds is None else time.perf_counter() + seconds
+
+    def remaining(self):
+        if self.end is None:
+            return gp.GRB.INFINITY
+        return max(0.0, self.end - time.perf_counter())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def limit(self, model):
+        # Bound the next solve of model by the time left
+        model.Params.TimeLimit = self.remaining()
@@ -5,6 +5,7 @@ class FrozenDict(collections.abc.Mapping):
 
     def __init__(self, *args, **kwargs):
         self._d = dict(*args, **kwargs)
+        self._hash = None
 
     def __iter__(self):
         return iter(self._d)
@@ -16,4 +17,7 @@ class FrozenDict(collections.abc.Mapping):
         return self._d[key]
 
     def __hash__(self):
-        return hash(frozenset(self._d))
\ No newline at end of file
+        # Hashing the values too keeps solutions with the same support apart
+        if self._hash is None:
+            self._hash = hash(frozenset(self._d.items()))
+        return self._hash
@@ -5,12 +5,69 @@ NUM_MULTICAST_REQUESTS = 2
 MAX_MULTICAST_SIZE = NUM_NODES//2
 DELAY = 2*MAX_MULTICAST_SIZE
 TOLERANCE = 0.01
+GAP_TOLERANCE = TOLERANCE # Relative gap between lambda and its lower bound at which solvers stop
 MAX_ITERS = 1000
 MAX_TIME = 180
 
+# Sweeps
+SWEEP_WORKERS = 0 # Processes running sweep tasks; 0 uses every core
+SWEEP_SEED = 0 # Added to the seed derived from each task's parameters and repetition
+
+# Results
+RESULTS_FLUSH_ROWS = 32 # Result rows buffered before they are written out
+RESULTS_FLUSH_SECS = 30 # Seconds after which buffered result rows are written out regardless
+RESULTS_COLUMNAR = False # Also keep a typed columnar copy of the results, one appendable file per column
+
+# Gurobi
+GUROBI_THREADS = 0 # Threads of each model; 0 lets Gurobi decide
+GUROBI_OUTPUT_FLAG = 1 # 0 silences Gurobi entirely
+GUROBI_LOG_TO_CONSOLE = 0 # Whether Gurobi's log is also printed
+GUROBI_LOG_FILE = "GurobiLogs/gurobi.log" # File Gurobi logs to; None or "" for none
+
+# Telemetry
+TELEMETRY_SINK = None # Path that solvers append per-iteration JSON lines to; None records nothing
+
+# Benchmarks
+BENCHMARK_PRICING_ROUNDS = 3 # Rounds of random prices each pricing engine is timed on
+BENCHMARK_TIME_TOLERANCE = 0.25 # Relative slowdown over the baseline reported as a regression
+BENCHMARK_MIN_SECS = 0.01 # Slowdowns smaller than this are noise
+BENCHMARK_QUALITY_TOLERANCE = 1e-6 # Relative increase of congestion or tree cost reported as a regression
+
+# Checkpoints
+CHECKPOINT_INTERVAL = 0 # Iterations between checkpoints of a solver with a checkpoint path; 0 disables them
+
+# Column Pool
+COLUMN_AGE_LIMIT = 0 # Solves a column may stay non-basic before removal; 0 disables aging
+COLUMN_AGE_REDCOST = TOLERANCE # Reduced cost above which a non-basic column ages
+PARTIAL_PRICING_LIMIT = 0 # Improving columns that end a pricing round early; 0 prices every request
+PRICING_WORKERS = 1 # Threads solving pricing problems of different requests at once
+
+# Exact pricing formulations
+MCF_FORMULATION = "MCF" # Multi-commodity flow, one commodity per recipient
+SCF_FORMULATION = "SCF" # Single-commodity flow: a much smaller model, but 2-7x slower per solve than MCF at 30-80 nodes
+EXACT_PRICING_FORMULATION = MCF_FORMULATION
+EXACT_PRICING_MIP_START = True # Seed each solve with the 2-approximation or best pooled tree
+EXACT_PRICING_EARLY_STOP = True # Stop each solve at the first tree with negative reduced cost
+
+# Dual stabilization
+STABILIZATION_WENTGES = "Wentges" # Price with a convex combination of the stability center and the duals
+STABILIZATION_BOXSTEP = "Boxstep" # Price with the duals projected into a box around the stability center
+STABILIZATION = STABILIZATION_WENTGES
+WENTGES_ALPHA = 0.5 # Weight of the stability center in Wentges smoothing
+BOXSTEP_WIDTH = 0.05 # Half-width of the box around the stability center
+
+# Memoization
+MEMO_CAPACITY = 16 # Solution-keyed values each memo of a solver keeps, least recently used dropped first
+HISTORY_SNAPSHOT_INTERVAL = 64 # Steps between the stored weights that Jansen-Zhang solutions are replayed from
+
+# Jansen-Zhang potential
+THETA_HIGH_PRECISION = False # Solve for theta with mpmath instead of float64 Newton
+THETA_MAX_NEWTON_ITERS = 100
+
 # Stop Flags
 NUM_STOP_FLAGS = 5
 STOP_DUALITYMATCH = 0b00000 # The way we are currently checking this is incorrect.
+STOP_FLAG_GAP = 0b10000 # Proven within GAP_TOLERANCE of optimal by the Lagrangian bound
 STOP_FLAG_REDCOST = 0b01000
 STOP_FLAG_TOL_MET = 0b00100
 STOP_FLAG_MAXITER = 0b00010
@@ -22,12 +79,14 @@ JZ2008_ID = "JZ"
 PERTCG_ID = "PC"
 FULLIP_ID = "IP"
 WARMST_ID = "WS"
+STABCG_ID = "SC"
 SOLVER_ID_LIST = [
     COLGEN_ID,
     JZ2008_ID,
     PERTCG_ID,
     FULLIP_ID,
-    WARMST_ID
+    WARMST_ID,
+    STABCG_ID
 ]
 BLOCK_APPROX_LEVELS = [
     2,
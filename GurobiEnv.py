@@ -0,0 +1,46 @@
+# The Gurobi environment models are created in, set up from GlobalConstants
+
+import os
+
+import gurobipy as gp
+
+import GlobalConstants
+
+# Process id -> environment. A forked process must not use its parent's
+# environment, so each process starts its own on first use.
+_envs = dict()
+# Process id -> number of workers -> the environment of each worker slot
+_worker_envs = dict()
+
+def shared_env():
+    # The environment of this process, which every model shares
+    pid = os.getpid()
+    if pid not in _envs:
+        _envs.clear()
+        _envs[pid] = new_env()
+    return _envs[pid]
+
+def worker_envs(workers):
+    # One environment per worker slot of this process, with the machine's
+    # threads split between them. Models of every instance priced in the
+    # process share them, so a process never starts more than these.
+    pid = os.getpid()
+    if pid not in _worker_envs:
+        _worker_envs.clear()
+        _worker_envs[pid] = dict()
+    if workers not in _worker_envs[pid]:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        _worker_envs[pid][workers] = [new_env(threads) for w in range(workers)]
+    return _worker_envs[pid][workers]
+
+def new_env(threads=GlobalConstants.GUROBI_THREADS):
+    # An environment with the configured settings; 0 threads lets Gurobi decide
+    env = gp.Env(empty=True)
+    env.setParam(gp.GRB.Param.OutputFlag, GlobalConstants.GUROBI_OUTPUT_FLAG)
+    env.setParam(gp.GRB.Param.LogToConsole, GlobalConstants.GUROBI_LOG_TO_CONSOLE)
+    if GlobalConstants.GUROBI_LOG_FILE:
+        os.makedirs(os.path.dirname(GlobalConstants.GUROBI_LOG_FILE) or ".", exist_ok=True)
+        env.setParam(gp.GRB.Param.LogFile, GlobalConstants.GUROBI_LOG_FILE)
+    env.setParam(gp.GRB.Param.Threads, threads)
+    env.start()
+    return env
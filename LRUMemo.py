@@ -0,0 +1,37 @@
+# Memo of per-solution quantities that keeps only the most recently used entries
+
+import collections
+
+class LRUMemo(collections.abc.MutableMapping):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._d = collections.OrderedDict()
+
+    def __contains__(self, key):
+        # Solvers check for a key before reading it, so lookups are counted here
+        if key in self._d:
+            self._d.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __getitem__(self, key):
+        return self._d[key]
+
+    def __setitem__(self, key, value):
+        self._d[key] = value
+        self._d.move_to_end(key)
+        while len(self._d) > self.capacity:
+            self._d.popitem(last=False)
+
+    def __delitem__(self, key):
+        del self._d[key]
+
+    def __iter__(self):
+        return iter(self._d)
+
+    def __len__(self):
+        return len(self._d)
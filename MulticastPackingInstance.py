@@ -1,27 +1,69 @@
 # Generating Multicast Packing Problem Instances
 
 # Imports
+import json
+import os
+from xml.etree import ElementTree
+
 import networkx as nx
+import numpy as np
 import random
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 import GlobalConstants
 import DebugConstants as db
 
 
+# Name of the edge attribute holding an edge's integer id
+EDGE_ID = "id"
+
+# Version and arrays of saved instances
+INSTANCE_FORMAT = 1
+INSTANCE_ARRAYS = ["nodes", "edges", "delays", "max_delay", "sources", "recipient_indptr", "recipient_indices"]
+
+def edge_ids(G):
+    # Ids of the edges of G (usually a tree view of an instance graph)
+    return np.fromiter((e_id for _, _, e_id in G.edges(data=EDGE_ID)), dtype=np.intp)
+
 def is_connected(G):
     return nx.is_k_edge_connected(G, 1)
 
-def get_random_connected_graph(n, m):
+def get_random_connected_graph(n, m, rng=random):
     degree = 2*m // n
     G = nx.empty_graph()
     while not is_connected(G):
-        G = nx.random_regular_graph(degree, n)
+        G = nx.random_regular_graph(degree, n, seed=rng)
     return G
 
+def get_fast_connected_graph(n, m, rng):
+    # Array form of an almost regular connected graph for large n: a random
+    # matching of degree stubs per node without loops or repeated edges, with
+    # each smaller component joined to the largest by one edge. rng is a
+    # numpy Generator. Returns the endpoints of each edge.
+    degree = max(2*m // n, 1)
+    stubs = rng.permutation(np.repeat(np.arange(n), degree))
+    stubs = stubs[:len(stubs) - len(stubs) % 2].reshape(-1, 2)
+    stubs = np.sort(stubs[stubs[:, 0] != stubs[:, 1]], axis=1)
+    stubs = np.unique(stubs, axis=0)
+    
+    num_components, component = connected_components(
+        coo_matrix((np.ones(len(stubs)), (stubs[:, 0], stubs[:, 1])), shape=(n, n)), directed=False)
+    if num_components > 1:
+        largest = np.argmax(np.bincount(component))
+        giant = np.flatnonzero(component == largest)
+        # One representative node of every other component
+        others = np.flatnonzero(np.diff(np.sort(component), prepend=-1) != 0)
+        others = np.argsort(component, kind='stable')[others]
+        others = others[component[others] != largest]
+        bridges = np.stack([others, rng.choice(giant, len(others))], axis=1)
+        stubs = np.concatenate([stubs, np.sort(bridges, axis=1)])
+    return stubs[:, 0], stubs[:, 1]
+
 class MulticastRequest:
-    def __init__(self, size, graph, source=None, recipients=None):
+    def __init__(self, size, graph, source=None, recipients=None, rng=random):
         if source is None and recipients is None:
-            multicast_group = random.sample(list(graph), size)
+            multicast_group = rng.sample(list(graph), size)
             source = multicast_group[0]
             recipients = set(multicast_group[1:])
         self.source = source
@@ -37,25 +79,223 @@ class MulticastPackingInstance:
                  max_request_size=GlobalConstants.MAX_MULTICAST_SIZE,
                  delay=GlobalConstants.DELAY,
                  graph=None, 
-                 requests=None
+                 requests=None,
+                 seed=None,
+                 edges=None
                 ):
+        # Without a seed, instances draw from the global random state
+        rng = random if seed is None else random.Random(seed)
         if graph is None:
-            graph = get_random_connected_graph(n, m)
+            graph = get_random_connected_graph(n, m, rng)
             for u,v in graph.edges():
-                graph[u][v]['delay'] = round(random.triangular(0, delay/2, delay*m/(n*n)))
+                graph[u][v]['delay'] = round(rng.triangular(0, delay/2, delay*m/(n*n)))
                 if  db.DEBUG_LEVEL >= db.DEBUG_LEVEL_FULL:
                     print(graph[u][v]['delay'])
         if requests is None:
             requests = list()
             for i in range(num_requests):
-                requests.append(MulticastRequest(max_request_size, graph))
-        self.graph = graph
-        self.pos = nx.kamada_kawai_layout(graph)
-        self.num_edges = len(self.graph.edges())
+                requests.append(MulticastRequest(max_request_size, graph, rng=rng))
+        # Instances made from arrays keep them, and build the graph from them
+        # only when it is first used
+        self._arrays = None
+        self._graph = graph
+        # The layout is only needed for drawing, so it is computed on first use
+        self._pos = None
+        
+        # edges, if given, lists the edges of graph in id order
+        self.index_edges(self._graph.edges() if edges is None else edges)
+        self.num_edges = len(self._edges)
         self.requests = requests
         self.num_requests = len(requests)
         self.delay = delay
         
+    @classmethod
+    def large(cls, n, m, num_requests, max_request_size, delay, seed=None):
+        # Same kind of instance as the constructor makes, built with arrays so
+        # that graphs of 10^4-10^5 nodes take seconds
+        rng = np.random.default_rng(seed)
+        u, v = get_fast_connected_graph(n, m, rng)
+        return cls.from_topology(u, v, None, num_requests, max_request_size, delay, rng)
+    
+    @classmethod
+    def from_topology(cls, u, v, delays, num_requests, max_request_size, delay, rng):
+        # Instance on the graph with edges (u[j], v[j]) between nodes 0..n-1, with
+        # delays drawn as the constructor draws them when not given, and
+        # random requests. rng is a numpy Generator.
+        n = int(max(u.max(), v.max())) + 1
+        if delays is None and delay > 0:
+            high = delay/2
+            delays = np.rint(rng.triangular(0, min(delay*len(u)/(n*n), high), high, len(u))).astype(int)
+        elif delays is None:
+            delays = np.zeros(len(u), dtype=int)
+        
+        graph = nx.empty_graph(n)
+        graph.add_edges_from((a, b, {'delay': d}) for a, b, d in zip(u.tolist(), v.tolist(), delays.tolist()))
+        
+        requests = list()
+        for i in range(num_requests):
+            multicast_group = rng.choice(n, max_request_size, replace=False).tolist()
+            requests.append(MulticastRequest(max_request_size, graph,
+                                             multicast_group[0], set(multicast_group[1:])))
+        return cls(n, graph.number_of_edges(), num_requests, max_request_size, delay,
+                   graph=graph, requests=requests)
+    
+    @classmethod
+    def from_edge_list(cls, path, num_requests, max_request_size, delay, seed=None):
+        # Lines are "u v" or "u v delay" with integer nodes; # starts a comment
+        with open(path) as edgeFile:
+            lines = [line.split('#')[0] for line in edgeFile]
+        rows = [line for line in lines if line.strip()]
+        columns = len(rows[0].split())
+        table = np.array(" ".join(rows).split(), dtype=np.float64).reshape(-1, columns)
+        delays = np.rint(table[:, 2]).astype(int) if columns > 2 else None
+        return cls.from_edges(table[:, 0].astype(np.intp), table[:, 1].astype(np.intp),
+                              delays, num_requests, max_request_size, delay, seed)
+    
+    @classmethod
+    def from_graphml(cls, path, num_requests, max_request_size, delay, seed=None):
+        # Streamed rather than read with networkx, which builds a graph with
+        # attribute dicts we would only throw away. Edge delays are read from a
+        # 'delay' attribute when every edge has one.
+        delay_keys = set()
+        index = dict()
+        u, v, delays = list(), list(), list()
+        for _, element in ElementTree.iterparse(path):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == "key" and element.get("attr.name") == "delay":
+                delay_keys.add(element.get("id"))
+            elif tag == "node":
+                index.setdefault(element.get("id"), len(index))
+                element.clear()
+            elif tag == "edge":
+                u.append(index.setdefault(element.get("source"), len(index)))
+                v.append(index.setdefault(element.get("target"), len(index)))
+                delays.append(next((float(data.text) for data in element
+                                    if data.get("key") in delay_keys), np.nan))
+                element.clear()
+        delays = np.array(delays)
+        delays = None if np.isnan(delays).any() else np.rint(delays).astype(int)
+        return cls.from_edges(np.array(u, dtype=np.intp), np.array(v, dtype=np.intp),
+                              delays, num_requests, max_request_size, delay, seed)
+    
+    @classmethod
+    def from_edges(cls, u, v, delays, num_requests, max_request_size, delay, seed):
+        # Keeps the largest connected component of the imported topology, without
+        # loops or repeated edges, with its nodes renumbered from 0
+        keep = u != v
+        u, v = np.minimum(u, v)[keep], np.maximum(u, v)[keep]
+        delays = None if delays is None else delays[keep]
+        pairs, first = np.unique(np.stack([u, v], axis=1), axis=0, return_index=True)
+        u, v = pairs[:, 0], pairs[:, 1]
+        delays = None if delays is None else delays[first]
+        
+        n = int(max(u.max(), v.max())) + 1
+        num_components, component = connected_components(
+            coo_matrix((np.ones(len(u)), (u, v)), shape=(n, n)), directed=False)
+        largest = np.argmax(np.bincount(component[np.concatenate([u, v])], minlength=num_components))
+        keep = component[u] == largest
+        relabel = np.cumsum(component == largest) - 1
+        u, v = relabel[u[keep]], relabel[v[keep]]
+        delays = None if delays is None else delays[keep]
+        return cls.from_topology(u, v, delays, num_requests, max_request_size, delay,
+                                 np.random.default_rng(seed))
+    
+    def index_edges(self, edges):
+        # Give each edge a stable integer id so per-edge data can live in arrays
+        self._edges = [tuple(sorted(e)) for e in edges]
+        self._edge_index = dict()
+        for e_id, (u, v) in enumerate(self._edges):
+            self._graph[u][v][EDGE_ID] = e_id
+            self._edge_index[(u, v)] = e_id
+            self._edge_index[(v, u)] = e_id
+    
+    def build_graph(self):
+        arrays = self._arrays
+        self._graph = nx.Graph()
+        self._graph.add_nodes_from(arrays["nodes"].tolist())
+        edges = arrays["edges"].tolist()
+        self._graph.add_edges_from((u, v, {'delay': d}) for (u, v), d in zip(edges, arrays["delays"].tolist()))
+        self.index_edges(edges)
+    
+    @property
+    def graph(self):
+        if self._graph is None:
+            self.build_graph()
+        return self._graph
+    
+    @property
+    def edges(self):
+        if self._graph is None:
+            self.build_graph()
+        return self._edges
+    
+    @property
+    def edge_index(self):
+        if self._graph is None:
+            self.build_graph()
+        return self._edge_index
+    
+    # Packed numeric form, shared by saved instances and solver checkpoints
+    def arrays(self):
+        if self._arrays is not None:
+            return dict(self._arrays)
+        recipients = [sorted(request.recipients) for request in self.requests]
+        return dict(
+            nodes=np.array(list(self.graph.nodes())),
+            edges=np.array(self.edges).reshape(-1, 2),
+            delays=np.array([self.graph.edges[e].get('delay', 0) for e in self.edges]),
+            max_delay=np.array(self.delay),
+            sources=np.array([request.source for request in self.requests]),
+            recipient_indptr=np.cumsum([0] + [len(r) for r in recipients]),
+            recipient_indices=np.array([v for r in recipients for v in r]),
+        )
+    
+    @classmethod
+    def from_arrays(cls, arrays):
+        # An instance with the same edge ids as the one arrays came from. The
+        # arrays are kept as given, memory-mapped or not, and the graph is
+        # built from them on first use.
+        instance = cls.__new__(cls)
+        instance._arrays = {name: arrays[name] for name in INSTANCE_ARRAYS}
+        instance._graph = instance._edges = instance._edge_index = instance._pos = None
+        instance.num_edges = len(arrays["edges"])
+        
+        indptr, indices = arrays["recipient_indptr"].tolist(), arrays["recipient_indices"].tolist()
+        instance.requests = [MulticastRequest(None, None, source, set(indices[indptr[i]:indptr[i + 1]]))
+                             for i, source in enumerate(arrays["sources"].tolist())]
+        instance.num_requests = len(instance.requests)
+        instance.delay = arrays["max_delay"].item()
+        return instance
+    
+    def save(self, path):
+        # A directory with one .npy file per array, so that they can be memory-mapped
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.arrays().items():
+            np.save(os.path.join(path, name + ".npy"), array)
+        with open(os.path.join(path, "instance.json"), 'w') as metaFile:
+            json.dump(dict(format=INSTANCE_FORMAT, num_edges=self.num_edges,
+                           num_requests=self.num_requests), metaFile)
+    
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "instance.json")) as metaFile:
+            meta = json.load(metaFile)
+        if meta["format"] != INSTANCE_FORMAT:
+            raise ValueError("{} has instance format {}, not {}".format(path, meta["format"], INSTANCE_FORMAT))
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode='r' if mmap else None)
+                  for name in INSTANCE_ARRAYS}
+        return cls.from_arrays(arrays)
+    
+    @property
+    def pos(self):
+        if self._pos is None:
+            self._pos = nx.kamada_kawai_layout(self.graph)
+        return self._pos
+    
+    def edge_dict(self, values):
+        # Convert an edge-id indexed array into a dict keyed by edge, for networkx
+        return dict(zip(self.edges, values))
+        
     def print_graph(self):
         nx.draw(self.graph, self.pos, with_labels=True)
         for request in self.requests:
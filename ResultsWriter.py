@@ -0,0 +1,240 @@
+# Buffered writing of result rows, with running per-group aggregates
+
+import csv
+import json
+import os
+import threading
+
+import numpy as np
+
+import GlobalConstants
+
+# Version of the columnar layout
+COLUMNAR_FORMAT = 1
+# Columns of any other type are kept as text, one JSON value per line
+NUMERIC_TYPES = ("int64", "float64")
+
+def means(sums, count):
+    # Means of the aggregated columns, left empty when no row had them
+    return (sums / count).tolist() if count else [None]*len(sums)
+
+def check_headers(path, found, expected):
+    # Rows are only ever added to files laid out for them
+    if list(found) != list(expected):
+        raise ValueError("{} has headers {}, not {}".format(path, found, expected))
+
+def column_type(value):
+    # Type of a column whose types were not given, from its first value
+    if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+        return "int64"
+    if value is None or isinstance(value, (float, np.floating)):
+        return "float64"
+    return "str"
+
+def column_file(path, c, dtype):
+    # Column files are named by position, since headers need not be file names
+    return os.path.join(path, "{}.{}".format(c, "bin" if dtype in NUMERIC_TYPES else "txt"))
+
+def read_columnar(path):
+    # The columns of a columnar directory by header: numeric ones as arrays,
+    # the rest as lists. A run cut short may have written some columns further
+    # than others, so only the rows every column has are returned.
+    with open(os.path.join(path, "schema.json")) as schemaFile:
+        schema = json.load(schemaFile)
+    if schema["format"] != COLUMNAR_FORMAT:
+        raise ValueError("{} has columnar format {}, not {}".format(path, schema["format"], COLUMNAR_FORMAT))
+    columns = list()
+    for c, dtype in enumerate(schema["types"]):
+        if dtype in NUMERIC_TYPES:
+            columns.append(np.fromfile(column_file(path, c, dtype), dtype=dtype))
+        else:
+            with open(column_file(path, c, dtype)) as columnFile:
+                columns.append([json.loads(line) for line in columnFile])
+    num_rows = min((len(column) for column in columns), default=0)
+    return {name: column[:num_rows] for name, column in zip(schema["headers"], columns)}
+
+class ResultsWriter:
+    # Rows are appended to a csv file held open for the whole run and written
+    # in batches of flush_rows, or flush_secs after the first row of a batch,
+    # whichever comes first, even if no row follows it. Alongside it are kept, optionally, a typed columnar copy of
+    # the rows (the directory path.columns, with one file per column that each
+    # batch is appended to) and a summary csv with the count and mean of the
+    # aggregated columns for each group of rows. Rows missing any aggregated
+    # value, such as runs that timed out before a first solution, are counted
+    # but left out of the means. The summary is kept in memory and written when
+    # the writer is closed.
+    def __init__(self, path, headers, group_by=(), aggregate=(), flags=(),
+                 summary_path=None, columnar=GlobalConstants.RESULTS_COLUMNAR, types=None,
+                 flush_rows=GlobalConstants.RESULTS_FLUSH_ROWS,
+                 flush_secs=GlobalConstants.RESULTS_FLUSH_SECS):
+        self.path = path
+        self.headers = list(headers)
+        self.group_by = [self.headers.index(name) for name in group_by]
+        self.aggregate = [self.headers.index(name) for name in aggregate]
+        # Bit strings, OR-ed together over a group
+        self.flags = [self.headers.index(name) for name in flags]
+        self.summary_path = summary_path
+        self.columnar_path = os.path.splitext(path)[0] + ".columns" if columnar else None
+        # Column types: "int64", "float64" or "str". Without them they are
+        # taken from the first row written.
+        self.types = None if types is None else list(types)
+        self.flush_rows = flush_rows
+        self.flush_secs = flush_secs
+
+        self.buffer = list()
+        # Rows are written by the caller or, once flush_secs have passed, by
+        # a timer, so buffer and files are only touched under the lock
+        self._lock = threading.Lock()
+        self._timer = None
+        self.num_rows = 0
+        # group -> [count, count of rows with every aggregated value,
+        #           sums of the aggregated columns over those rows, OR of the flags]
+        self.groups = dict()
+
+        # A run writing to files left by an earlier one carries on from them
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            with open(path, newline='') as allFile:
+                check_headers(path, next(csv.reader(allFile), []), self.headers)
+        if summary_path is not None and not new_file:
+            # The summary is only written on close, so one older than the csv
+            # was left by a run that stopped early, and the csv is read instead
+            if os.path.exists(summary_path) and os.path.getmtime(summary_path) >= os.path.getmtime(path):
+                self.read_summary()
+            else:
+                self.read_groups()
+        if self.columnar_path is not None and os.path.exists(os.path.join(self.columnar_path, "schema.json")):
+            with open(os.path.join(self.columnar_path, "schema.json")) as schemaFile:
+                schema = json.load(schemaFile)
+            check_headers(self.columnar_path, schema["headers"], self.headers)
+            self.types = schema["types"]
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(self.headers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, row):
+        with self._lock:
+            self.buffer.append(row)
+            self.num_rows += 1
+            if self.aggregate or self.flags:
+                self.accumulate(row)
+            if len(self.buffer) >= self.flush_rows:
+                self.write_buffer()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_secs, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def accumulate(self, row):
+        key = tuple(str(row[c]) for c in self.group_by)
+        if key not in self.groups:
+            self.groups[key] = [0, 0, np.zeros(len(self.aggregate)), 0]
+        group = self.groups[key]
+        group[0] += 1
+        values = [row[c] for c in self.aggregate]
+        if all(value is not None and value != '' for value in values):
+            group[1] += 1
+            group[2] += [float(value) for value in values]
+        for c in self.flags:
+            group[3] |= int(str(row[c]), 2)
+
+    def summary(self):
+        # group -> dict of the row counts and the mean of each aggregated column
+        retval = dict()
+        for key, (count, solved, sums, flags) in self.groups.items():
+            retval[key] = dict(zip(self.headers_of(self.aggregate), means(sums, solved)))
+            retval[key]["Count"] = count
+            retval[key]["Solved"] = solved
+            if self.flags:
+                retval[key]["Flags"] = flags
+        return retval
+
+    def headers_of(self, columns):
+        return [self.headers[c] for c in columns]
+
+    def summary_headers(self):
+        return (self.headers_of(self.group_by) + ["Count", "Solved"]
+                + self.headers_of(self.aggregate) + self.headers_of(self.flags[:1]))
+
+    def flush(self):
+        with self._lock:
+            self.write_buffer()
+
+    def write_buffer(self):
+        # Only the rows written since the last flush are written out
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.buffer and self._file is not None:
+            self._writer.writerows(self.buffer)
+            self._file.flush()
+            if self.columnar_path is not None:
+                self.append_columnar(self.buffer)
+        self.buffer = list()
+
+    def append_columnar(self, rows):
+        if self.types is None:
+            self.types = [column_type(value) for value in rows[0]]
+        schema_path = os.path.join(self.columnar_path, "schema.json")
+        if not os.path.exists(schema_path):
+            os.makedirs(self.columnar_path, exist_ok=True)
+            with open(schema_path, 'w') as schemaFile:
+                json.dump(dict(format=COLUMNAR_FORMAT, headers=self.headers, types=self.types), schemaFile)
+        for c, (column, dtype) in enumerate(zip(zip(*rows), self.types)):
+            if dtype in NUMERIC_TYPES:
+                # Missing values are stored as NaN
+                values = np.array([np.nan if value is None else value for value in column], dtype=dtype)
+                with open(column_file(self.columnar_path, c, dtype), 'ab') as columnFile:
+                    values.tofile(columnFile)
+            else:
+                with open(column_file(self.columnar_path, c, dtype), 'a') as columnFile:
+                    columnFile.writelines(json.dumps(value if value is None else str(value)) + "\n"
+                                          for value in column)
+
+    def write_summary(self):
+        with open(self.summary_path + ".tmp", 'w', newline='') as sumFile:
+            sumWriter = csv.writer(sumFile)
+            sumWriter.writerow(self.summary_headers())
+            for key, (count, solved, sums, flags) in self.groups.items():
+                sumWriter.writerow(list(key) + [count, solved] + means(sums, solved)
+                                   + ["{:05b}".format(flags)]*bool(self.flags))
+        os.replace(self.summary_path + ".tmp", self.summary_path)
+
+    def read_summary(self):
+        # Means are turned back into sums, so the csv need not be read again
+        g, a = len(self.group_by), len(self.aggregate)
+        with open(self.summary_path, newline='') as sumFile:
+            rows = list(csv.reader(sumFile))
+        check_headers(self.summary_path, rows[0] if rows else [], self.summary_headers())
+        for row in rows[1:]:
+            count, solved = int(row[g]), int(row[g + 1])
+            self.groups[tuple(row[:g])] = [
+                count,
+                solved,
+                solved*np.array([float(value or 0) for value in row[g + 2:g + 2 + a]]),
+                int(row[g + 2 + a], 2) if self.flags else 0]
+
+    def read_groups(self):
+        # Aggregates of the rows already in the csv
+        with open(self.path, newline='') as allFile:
+            rows = csv.reader(allFile)
+            next(rows, None)
+            for row in rows:
+                self.accumulate(row)
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self.write_buffer()
+            self._file.close()
+            self._file = None
+        if self.summary_path is not None:
+            self.write_summary()
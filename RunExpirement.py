@@ -2,119 +2,206 @@
 ## Std Lib
 import time
 import csv
+import os
+import random
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from statistics import fmean as mean
+## Third Party
+import numpy as np
 ## Local files
 import GlobalConstants
 import DebugConstants as db
+from Deadline import Deadline
+from ResultsWriter import ResultsWriter
 from MulticastPackingInstance import MulticastPackingInstance
 from Solvers.Impls.PureColGenMcpSolver import PureColGenMcpSolver
 from Solvers.Impls.JansenZhangMinMaxer import JansenZhangMinMaxer
 from Solvers.Impls.PerturbedColGenMcpSolver import PerturbedColGenMcpSolver
 from Solvers.Impls.ColGenIPSolver import ColGenIPSolver
 from Solvers.Impls.WarmStartColGenMcpSolver import WarmStartColGenMcpSolver
+from Solvers.Impls.StabilizedColGenMcpSolver import StabilizedColGenMcpSolver
 
 def runExpirement(datetime_str, numReps, paramList, approxLevels, solverTypes, solverList):
-    #tableRows = list()
-    #tableRows2 = list()
-    
-    for label,n,m,k,s,d in paramList:
-        if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_0:
-            print("Parameter Loop: |V|={}, |E|={}, k={}, |S_i|<={}, D = {}".format(n,m,k,s,d))
-        
-        totalIter = {(apx, solver_id): list() 
-                     for apx in approxLevels
-                     for solver_id in solverTypes}
-        secsPerIt = {(apx, solver_id): list() 
-                     for apx in approxLevels
-                     for solver_id in solverTypes}
-        totalSecs = {(apx, solver_id): list() 
-                     for apx in approxLevels
-                     for solver_id in solverTypes}
-        FinObjVal = {(apx, solver_id): list() 
-                     for apx in approxLevels
-                     for solver_id in solverTypes}
-        FinPotVal = {(apx, solver_id): list() 
-                     for apx in approxLevels
-                     for solver_id in solverTypes}
-        StopFlags = {(apx, solver_id): 0b0000
-                     for apx in approxLevels
-                     for solver_id in solverTypes}
-
-        for i in range(numReps):
+    with resultsWriter(datetime_str, SWEEP_HEADERS[:16]) as results:
+        for label,n,m,k,s,d in paramList:
             if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_0:
-                print("\t Instance Repitition: {}".format(i))
-            instance =  MulticastPackingInstance(n,m,k,s,d)
-
-            for apx in approxLevels:
-                for solver_id in solverTypes:
-                    if solver_id == GlobalConstants.COLGEN_ID:
-                        solver = PureColGenMcpSolver(instance=instance, block_approx=apx)
-                    elif solver_id == GlobalConstants.JZ2008_ID:
-                        solver = JansenZhangMinMaxer(instance=instance, block_approx=apx)
-                    elif solver_id == GlobalConstants.PERTCG_ID:
-                        solver = PerturbedColGenMcpSolver(instance=instance, block_approx=apx)
-                    elif solver_id == GlobalConstants.FULLIP_ID:
-                        solver = ColGenIPSolver(instance=instance, block_approx=apx)
-                    elif solver_id == GlobalConstants.WARMST_ID:
-                        solver = WarmStartColGenMcpSolver(instance=instance, block_approx=apx)
-
-                    if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_0:
-                        print("\t\t Algo: {} \t Block Approx: {}".format(solver_id, apx))
-                    try:
-                        timer = list()
-                        total_time = 0
-                        while(not solver.stop_flag):
-                            prev_time = time.perf_counter()
-                            solver.perform_iteration()
-                            new_time = time.perf_counter()
-                            timer.append(new_time - prev_time)
-                            total_time += new_time - prev_time
-                            if total_time > GlobalConstants.MAX_TIME:
-                                solver.stop_flag |= GlobalConstants.STOP_FLAG_TIMEOUT
-
-                        x = solver.solution[solver.iteration]
-                        totalIter[apx, solver_id].append(solver.iteration)
-                        secsPerIt[apx, solver_id].append(mean(timer))
-                        totalSecs[apx, solver_id].append(sum(timer))
-                        FinObjVal[apx, solver_id].append(solver.lamb(x))
-                        FinPotVal[apx, solver_id].append(solver.phi(x, solver.t))
-                        StopFlags[apx, solver_id] |= solver.stop_flag
-
-                        newRow = [
-                            label,
-                            solver_id, apx,
-                            n,m,k,s,d,
-                            solver.lamb(x),
-                            solver.phi(x, solver.t),
-                            solver.iteration,
-                            sum(timer),
-                            mean(timer),
-                            "{:05b}".format(solver.stop_flag)
-                        ]
-                        #solverList.append(solver) # I Think this causes the program to use too much RAM
-                        with open("outputs/{}.csv".format(datetime_str),'a') as allFile:
-                            allWriter = csv.writer(allFile)
-                            allWriter.writerow(newRow)
-                        
-                    except Exception as e:
-                        print(repr(e))
-
-#         for apx in approxLevels:
-#             for solver_id in solverTypes:
-#                 try:
-#                     avgTotalIter = mean(totalIter[apx, solver_id])
-#                     avgSecsPerIt = mean(secsPerIt[apx, solver_id])
-#                     avgtotalSecs = mean(totalSecs[apx, solver_id])
-#                     avgFinObjVal = mean(FinObjVal[apx, solver_id])
-#                     avgFinPotVal = mean(FinPotVal[apx, solver_id])
-#                     newRow = [label, solver_id, apx, n, m, k, s, d,
-#                           avgFinObjVal, avgFinPotVal, avgTotalIter, 
-#                           avgtotalSecs, avgSecsPerIt, 
-#                           "{:05b}".format(StopFlags[apx, solver_id])]
-
-
-#     with open("outputs/summaries/summary_{}.csv".format(datetime_str),'a') as sumFile:
-#         sumWriter = csv.writer(sumFile)
-#         sumWriter.writerow(newRow)
-        
-    return solverList
\ No newline at end of file
+                print("Parameter Loop: |V|={}, |E|={}, k={}, |S_i|<={}, D = {}".format(n,m,k,s,d))
+
+            for i in range(numReps):
+                if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_0:
+                    print("\t Instance Repitition: {}".format(i))
+                instance =  MulticastPackingInstance(n,m,k,s,d)
+
+                for apx in approxLevels:
+                    for solver_id in solverTypes:
+                        # The time limit covers building the solver too
+                        solver = newSolver(solver_id, instance, apx, Deadline(GlobalConstants.MAX_TIME))
+
+                        if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_0:
+                            print("\t\t Algo: {} \t Block Approx: {}".format(solver_id, apx))
+                        try:
+                            timer = runSolver(solver)
+
+                            newRow = [
+                                label,
+                                solver_id, apx,
+                                n,m,k,s,d,
+                            ] + solverResults(solver, timer)
+                            #solverList.append(solver) # I Think this causes the program to use too much RAM
+                            results.write(newRow)
+
+                        except Exception as e:
+                            print(repr(e))
+
+    return solverList
+
+def newSolver(solver_id, instance, apx, deadline=None):
+    if solver_id == GlobalConstants.COLGEN_ID:
+        return PureColGenMcpSolver(instance=instance, block_approx=apx, deadline=deadline)
+    elif solver_id == GlobalConstants.JZ2008_ID:
+        return JansenZhangMinMaxer(instance=instance, block_approx=apx, deadline=deadline)
+    elif solver_id == GlobalConstants.PERTCG_ID:
+        return PerturbedColGenMcpSolver(instance=instance, block_approx=apx, deadline=deadline)
+    elif solver_id == GlobalConstants.FULLIP_ID:
+        return ColGenIPSolver(instance=instance, block_approx=apx, deadline=deadline)
+    elif solver_id == GlobalConstants.WARMST_ID:
+        return WarmStartColGenMcpSolver(instance=instance, block_approx=apx, deadline=deadline)
+    elif solver_id == GlobalConstants.STABCG_ID:
+        return StabilizedColGenMcpSolver(instance=instance, block_approx=apx, deadline=deadline)
+
+def runSolver(solver, max_time=None):
+    # Iterate until the solver stops or its deadline passes, and return the
+    # time each iteration took. max_time, if given, replaces the deadline the
+    # solver was built with.
+    timer = list()
+    if max_time is not None:
+        solver.set_deadline(Deadline(max_time))
+    while(not solver.stop_flag):
+        prev_time = time.perf_counter()
+        solver.perform_iteration()
+        new_time = time.perf_counter()
+        timer.append(new_time - prev_time)
+    return timer
+
+def solverResults(solver, timer):
+    # The result columns of a sweep row, from Congestion to Gap. A solver whose
+    # time ran out before its first solution has no congestion, potential or gap.
+    if solver.iteration < 0:
+        lamb = potential = gap = None
+    else:
+        x = solver.solution[solver.iteration]
+        lamb, potential, gap = solver.lamb(x), solver.phi(x, solver.t), solver.gap(x)
+    return [
+        lamb,
+        potential,
+        solver.iteration,
+        sum(timer),
+        mean(timer) if timer else 0.0,
+        "{:05b}".format(solver.stop_flag),
+        solver.lower_bound,
+        gap
+    ]
+
+# Parallel Sweeps
+SWEEP_HEADERS = [
+    "Label",
+    "Solver", 
+    "Block Apx Ratio", 
+    "Vertices",
+    "Edges",
+    "Requests",
+    "Group Size", 
+    "Max Delay",
+    "Congestion", 
+    "Potential",
+    "Iterations",
+    "Total Time",
+    "Avg. Time/It",
+    "Stop Flags",
+    "Lower Bound",
+    "Gap",
+    "Repetition",
+    "Seed"
+]
+
+# Types of the sweep columns in the columnar copy of the results. The block
+# approximation ratio can be "Delay", so it is kept as text.
+SWEEP_TYPES = ["str", "str", "str"] + ["int64"]*5 + ["float64"]*2 + ["int64"] + ["float64"]*2 + ["str"] \
+    + ["float64"]*2 + ["int64"]*2
+
+# Results are summarized over the repetitions of each parameter set
+SUMMARY_GROUPS = SWEEP_HEADERS[:8]
+SUMMARY_AGGREGATES = SWEEP_HEADERS[8:13] + ["Lower Bound", "Gap"]
+
+def resultsWriter(datetime_str, headers):
+    # Rows go to outputs/<datetime>.csv and running means to outputs/summaries
+    os.makedirs("outputs/summaries", exist_ok=True)
+    return ResultsWriter("outputs/{}.csv".format(datetime_str), headers, types=SWEEP_TYPES[:len(headers)],
+                         group_by=SUMMARY_GROUPS, aggregate=SUMMARY_AGGREGATES, flags=["Stop Flags"],
+                         summary_path="outputs/summaries/summary_{}.csv".format(datetime_str))
+
+def runSweep(datetime_str, numReps, paramList, approxLevels, solverTypes,
+             workers=GlobalConstants.SWEEP_WORKERS, resume=False):
+    # Run every (parameters, repetition, approximation level, solver) task of a
+    # sweep on a pool of processes, writing each row as its task finishes. With
+    # resume, tasks that already have a row in the output file are skipped.
+    path = "outputs/{}.csv".format(datetime_str)
+    tasks = [(label,n,m,k,s,d, rep, apx, solver_id)
+             for label,n,m,k,s,d in paramList
+             for rep in range(numReps)
+             for apx in approxLevels
+             for solver_id in solverTypes]
+    
+    done = set()
+    if resume and os.path.exists(path):
+        with open(path, newline='') as allFile:
+            for row in csv.DictReader(allFile):
+                if row.get("Repetition"):
+                    done.add(taskKey(row["Label"], row["Vertices"], row["Edges"],
+                                     row["Requests"], row["Group Size"], row["Max Delay"],
+                                     row["Repetition"], row["Block Apx Ratio"], row["Solver"]))
+    tasks = [task for task in tasks if taskKey(*task) not in done]
+    if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_0:
+        print("Sweep: {} tasks to run, {} already recorded".format(len(tasks), len(done)))
+    
+    with ProcessPoolExecutor(max_workers=workers or None) as executor, \
+         resultsWriter(datetime_str, SWEEP_HEADERS) as results:
+        futures = [executor.submit(runSweepTask, task) for task in tasks]
+        for future in as_completed(futures):
+            newRow = future.result()
+            if newRow is not None:
+                results.write(newRow)
+
+def runSweepTask(task):
+    label,n,m,k,s,d, rep, apx, solver_id = task
+    # A task's time limit covers building its instance and solver too
+    deadline = Deadline(GlobalConstants.MAX_TIME)
+    # Every solver and approximation level of a repetition gets the same instance
+    seed = taskSeed(label,n,m,k,s,d, rep)
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        instance = MulticastPackingInstance(n,m,k,s,d)
+        solver = newSolver(solver_id, instance, apx, deadline)
+        timer = runSolver(solver)
+        return [
+            label,
+            solver_id, apx,
+            n,m,k,s,d,
+        ] + solverResults(solver, timer) + [
+            rep,
+            seed
+        ]
+    except Exception as e:
+        print(repr(e))
+        return None
+
+def taskSeed(label,n,m,k,s,d, rep):
+    # Stable across runs and processes, unlike hash()
+    key = repr((label,n,m,k,s,d, rep)).encode()
+    return (GlobalConstants.SWEEP_SEED + zlib.crc32(key)) % 2**32
+
+def taskKey(label,n,m,k,s,d, rep, apx, solver_id):
+    # Tasks are matched against rows read back from csv, so compare as strings
+    return tuple(str(value) for value in (label,n,m,k,s,d, rep, apx, solver_id))
@@ -0,0 +1,89 @@
+# Convex combinations of trees built one step at a time, as in Jansen-Zhang
+
+import collections
+
+import numpy as np
+
+import GlobalConstants
+from FrozenDict import FrozenDict
+
+class SolutionHistory:
+    # Step k scales every weight by 1 - step_sizes[k] and adds step_sizes[k] to
+    # the weight of trees[k][i] for each request i. Steps only ever append, so
+    # every earlier solution stays readable.
+    def __init__(self, num_requests):
+        self.num_requests = num_requests
+        self.step_sizes = list()
+        self.trees = list()
+        # Distinct trees of each request in order of first use, as pool columns
+        # and as trees, and the position among them of each step's tree
+        self.columns = [list() for i in range(num_requests)]
+        self.distinct = [list() for i in range(num_requests)]
+        self.seen = [dict() for i in range(num_requests)]
+        self.positions = list()
+        
+        # Weights are replayed forward from the nearest snapshot, taken every
+        # snapshot_interval steps, or from the last weights replayed
+        self.snapshot_interval = GlobalConstants.HISTORY_SNAPSHOT_INTERVAL
+        self.snapshots = {0: [np.zeros(0)] * num_requests}
+        self.last = (0, self.snapshots[0])
+
+    def step(self, step_size, new_trees, new_columns):
+        for i in range(self.num_requests):
+            if new_trees[i] not in self.seen[i]:
+                self.seen[i][new_trees[i]] = len(self.columns[i])
+                self.columns[i].append(new_columns[i])
+                self.distinct[i].append(new_trees[i])
+        self.step_sizes.append(step_size)
+        self.trees.append(tuple(new_trees))
+        self.positions.append(tuple(self.seen[i][new_trees[i]] for i in range(self.num_requests)))
+        
+        length = len(self.step_sizes)
+        support = tuple(len(self.columns[i]) for i in range(self.num_requests))
+        if length % self.snapshot_interval == 0:
+            self.snapshots[length] = self.weights(length, support)
+        return Solution(self, length, support)
+
+    def weights(self, length, support):
+        # Weight of each distinct tree of every request after the first length
+        # steps, as arrays over the first support[i] distinct trees
+        start = length - length % self.snapshot_interval
+        if start not in self.snapshots:
+            # Only while the snapshot at length itself is being taken
+            start -= self.snapshot_interval
+        weights = self.snapshots[start]
+        if start < self.last[0] <= length:
+            start, weights = self.last
+        if start == length:
+            return weights
+        
+        weights = [np.concatenate([w, np.zeros(n - len(w))]) for w, n in zip(weights, support)]
+        for k in range(start, length):
+            step_size = self.step_sizes[k]
+            for i in range(self.num_requests):
+                weights[i] *= 1 - step_size
+                weights[i][self.positions[k][i]] += step_size
+        self.last = (length, weights)
+        return weights
+
+class Solution(collections.abc.Sequence):
+    # The solution after the first length steps of a history. It is hashed and
+    # compared by identity, so memo lookups never touch the weights.
+    def __init__(self, history, length, support):
+        self.history = history
+        self.length = length
+        self.support = support
+
+    def __len__(self):
+        return self.history.num_requests
+
+    def __getitem__(self, i):
+        weights = self.history.weights(self.length, self.support)[i]
+        return FrozenDict(zip(self.history.distinct[i][:self.support[i]], weights.tolist()))
+
+    def columns(self, i):
+        # Pool columns of the trees of request i
+        return self.history.columns[i][:self.support[i]]
+
+    __hash__ = object.__hash__
+    __eq__ = object.__eq__
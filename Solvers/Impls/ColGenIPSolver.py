@@ -2,13 +2,14 @@
 
 import gurobipy as gp
 import networkx as nx
+import numpy as np
 
-from Solvers.Impls.PureColGenMcpSolver import PureColGenMcpSolver, cost
+from Solvers.Impls.PureColGenMcpSolver import PureColGenMcpSolver
 #from PureColGenMcpSolver import cost
 
 class ColGenIPSolver(PureColGenMcpSolver):
-    def __init__(self, instance=None, block_approx=2):
-        super().__init__(instance, block_approx)
+    def __init__(self, instance=None, block_approx=2, deadline=None):
+        super().__init__(instance, block_approx, deadline=deadline)
         
         self.column_generator.varType = gp.GRB.INTEGER
         
@@ -26,29 +27,19 @@ class ColGenIPSolver(PureColGenMcpSolver):
 #                 print(self.column_generator.Gurobi_variables[i][T])
         
             
+    def pricing_filter(self, x):
+        # The prices of the integer master are not duals, so every tree is kept
+        return None, None
+            
     def generate_p(self, x, t=None):
         if not t:
             t = self.t
-        newPriceDict = dict()
-        for edge in self.instance.graph.edges():
-            e = tuple(sorted(edge))
-            if self.f(x)[e] == self.lamb(x):
-                newPriceDict[e] = 1
-            else:
-                newPriceDict[e] = 0
-        
-        newPriceDict = {e: newPriceDict[e] / sum(list(newPriceDict.values())) for e in newPriceDict}
-        self.price[(x,t)] = newPriceDict
+        newPrices = (self.f(x) == self.lamb(x)).astype(np.float64)
+        self.price[(x,t)] = newPrices / newPrices.sum()
                 
     def generate_q(self, x, t=None):
         if not t:
             t = self.t
-        newCostDict = [self.instance.num_edges] * len(self.instance.requests)
-        prices = self.p(x)
-        for i in range(self.instance.num_requests):
-            for T in self.column_generator.Gurobi_variables[i]:
-                Tcost = cost(T, prices)
-                if Tcost < newCostDict[i]:
-                    newCostDict[i] = Tcost
-            
-        self.multicast_costs[(x,t)] = newCostDict
\ No newline at end of file
+        self.multicast_costs[(x,t)] = np.minimum(
+            self.column_generator.column_pool.min_costs(self.p(x)),
+            self.instance.num_edges)
\ No newline at end of file
@@ -2,59 +2,83 @@
 
 from math import log
 
-import mpmath as mp
+import numpy as np
 
 import GlobalConstants
 import DebugConstants as db
-from FrozenDict import FrozenDict
-from Solvers.MulticastPackingSolver import MulticastPackingSolver, cost, dict_innerProd
-#from MulticastPackingSolver import dict_innerProd
+from SolutionHistory import SolutionHistory
+from LRUMemo import LRUMemo
+from MulticastPackingInstance import edge_ids
+from Solvers.MulticastPackingSolver import MulticastPackingSolver, cost
    
 class JansenZhangMinMaxer(MulticastPackingSolver):
     
-    def __init__(self, instance=None, block_approx=2, sigma0=1):
-        super().__init__(instance, block_approx)
-        self.sigma = mp.mpf(sigma0)
+    def __init__(self, instance=None, block_approx=2, sigma0=1, deadline=None):
+        super().__init__(instance, block_approx, deadline=deadline)
+        self.sigma = float(sigma0)
         self.t = self.sigma/6
-        self.M = mp.mpf(len(self.instance.graph.edges()))
-        self.theta_dict = dict()
-        self.phi_dict = dict()
+        self.M = float(len(self.instance.graph.edges()))
+        self.theta_dict = LRUMemo(GlobalConstants.MEMO_CAPACITY)
+        self.phi_dict = LRUMemo(GlobalConstants.MEMO_CAPACITY)
         self.finished_coordination = False
         self.lambda_of_prev_scaling = 0
         self.w = None
+        self.history = SolutionHistory(self.instance.num_requests)
         
     def get_next_solution(self):
+        # The new load is the same convex combination of the current load and
+        # the load of the new trees as the new solution
+        f_prime = self.new_tree_load()
+
         if self.iteration == -1:
-            x = [dict() for i in range(self.instance.num_requests)]
-            step_size = mp.mpf(1)
+            f = np.zeros(self.instance.num_edges)
+            step_size = 1.0
         else:
             x = self.solution[self.iteration]
-            
-            f_prime = dict()
-            for e in self.instance.graph.edges():
-                f_prime[tuple(sorted(e))] = mp.mpf(0)
-                for i in range(self.instance.num_requests):
-                    if self.new_trees[i].has_edge(*e):
-                        f_prime[tuple(sorted(e))] += mp.mpf(1)
+            f = self.f(x)
     
-            pf = dict_innerProd(self.p(x, self.t), self.f(x))
-            pf_prime = dict_innerProd(self.p(x, self.t), f_prime)
-            step_size = ( (self.t*self.theta(x, self.t)*self.toleranceFunction()) 
+            p = self.p(x, self.t)
+            pf = p @ f
+            pf_prime = p @ f_prime
+            step_size = float( (self.t*self.theta(x, self.t)*self.toleranceFunction()) 
                    /(2*self.M*(pf+pf_prime)) )
 
+        # Only the new trees are touched; weights are recovered from the history
+        pool = self.column_generator.column_pool
+        new_x = self.history.step(step_size, self.new_trees,
+                                  [pool.column_of[T] for T in self.new_trees])
+        self.fVal[new_x] = (1-step_size)*f + step_size*f_prime
+        return new_x
+    
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        pool = self.column_generator.column_pool
+        state.update(
+            sigma=self.sigma, t=self.t,
+            w=np.nan if self.w is None else self.w,
+            lambda_of_prev_scaling=self.lambda_of_prev_scaling,
+            step_sizes=np.array(self.history.step_sizes),
+            step_columns=np.array([[pool.column_of[T] for T in trees] for trees in self.history.trees],
+                                  dtype=np.intp).reshape(-1, self.instance.num_requests))
+        return state
+    
+    def restore_state(self, state):
+        columns = super().restore_state(state)
+        pool = self.column_generator.column_pool
+        self.sigma = float(state["sigma"])
+        self.t = float(state["t"])
+        self.w = None if np.isnan(state["w"]) else float(state["w"])
+        self.lambda_of_prev_scaling = float(state["lambda_of_prev_scaling"])
         
-        new_x = [dict() for i in range(self.instance.num_requests)]
-
-        for i in range(self.instance.num_requests):
-            for T in x[i]:
-                new_x[i][T] = (1-step_size)*x[i][T]
-                
-            if self.new_trees[i] in x[i]:
-                new_x[i][self.new_trees[i]] += step_size
-            else:
-                new_x[i][self.new_trees[i]] = step_size
-            new_x[i] = FrozenDict(new_x[i])
-        return tuple(new_x)
+        # Replaying the steps gives back the history, and with it the solution.
+        # Solvers that only borrow the Jansen-Zhang prices have no steps.
+        self.history = SolutionHistory(self.instance.num_requests)
+        for step_size, step_columns in zip(state["step_sizes"], columns[state["step_columns"]]):
+            x = self.history.step(float(step_size), [pool.trees[col] for col in step_columns], step_columns)
+        if len(self.history.step_sizes):
+            self.solution[self.iteration] = x
+            self.restore_values(x, state)
+        return columns
     
     def perform_checks_and_updates(self, x):
         t = self.t
@@ -69,7 +93,7 @@ class JansenZhangMinMaxer(MulticastPackingSolver):
         if self.w == None:
             self.sigma = self.sigma/2
             self.t = self.sigma/6
-            self.w = mp.mpf((1+self.sigma)/((1+self.sigma/3)*self.M))
+            self.w = (1+self.sigma)/((1+self.sigma/3)*self.M)
             self.lambda_of_prev_scaling = self.lamb(x)
             if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_1:
                 print("Scaling Phase 0 Over")
@@ -79,6 +103,7 @@ class JansenZhangMinMaxer(MulticastPackingSolver):
                 print("w = {}".format(self.w))
             
             self.new_trees = self.column_generator.generate_new_trees(self.p(x, self.t))
+            self.update_lower_bound()
         elif (
                 (self.toleranceFunction() <= self.sigma/6) or 
                 (self.lamb(x) <= self.w*self.lambda_of_prev_scaling) 
@@ -89,8 +114,9 @@ class JansenZhangMinMaxer(MulticastPackingSolver):
                 self.lambda_of_prev_scaling= self.lamb(x)
                 self.sigma = self.sigma/2
                 self.t = self.sigma/6
-                self.w = mp.mpf((1+self.sigma)/(1+2*self.sigma))
+                self.w = (1+self.sigma)/(1+2*self.sigma)
                 self.new_trees = self.column_generator.generate_new_trees(self.p(x, self.t))
+                self.update_lower_bound()
             if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_1:
                 print("New Scaling Phase")
             if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_2:
@@ -103,41 +129,53 @@ class JansenZhangMinMaxer(MulticastPackingSolver):
                 
     
     def generate_lamb(self, x):
-        self.objVal[x] = max(self.f(x).values())
+        self.objVal[x] = float(self.f(x).max())
     
     def generate_fVal(self, x):
-        self.fVal[x] = {tuple(sorted(e)): 0 for e in self.instance.graph.edges()}
+        # Loads are normally stored as each solution is made, so this only runs
+        # for solutions whose load has been evicted
+        fVal = np.zeros(self.instance.num_edges)
         for i in range(self.instance.num_requests):
-            for T in x[i]:
-                for e in T.edges():
-                    self.fVal[x][tuple(sorted(e))] += x[i][T]
+            for T, weight in x[i].items():
+                fVal[edge_ids(T)] += weight
+        self.fVal[x] = fVal
         
     def generate_p(self, x, t):
-        self.price[(x,t)] = dict()
-        for e in self.instance.graph.edges():
-            self.price[(x,t)][tuple(sorted(e))] = t*self.theta(x,t)/(self.M*(self.theta(x,t) 
-                                                                              - self.f(x)[tuple(sorted(e))]))
+        theta = float(self.theta(x,t))
+        self.price[(x,t)] = t*theta/(self.M*(theta - self.f(x)))
 
     def generate_q(self, x, t=None):
         if not t:
             t = self.t
         
-        self.multicast_costs[(x,t)] = [
-            min(cost(T, self.p(x, t)) for T in x[i].keys()) 
-                for i in range(self.instance.num_requests)]
+        # Prices move on every edge at each step, so this costs every pooled
+        # column again and is linear in the number of columns. In a JZ run the
+        # support of x is nearly the whole pool, so costing only it saves nothing.
+        pool = self.column_generator.column_pool
+        costs = pool.costs(self.p(x, t))
+        self.multicast_costs[(x,t)] = np.array([
+            costs[x.columns(i)].min() 
+                for i in range(self.instance.num_requests)])
         
     def generate_theta(self, x, t):
-        self.theta_dict[(x,t)] = (
-            mp.findroot(lambda theta: theta_eq(theta, t, self.M, self.f(x)),
-                        (mp.mpf(self.lamb(x)/(1-t/self.M)), mp.mpf(self.lamb(x)/(1-t))), 
-                        solver='ridder')
-        )
+        # theta is the root of theta_eq above lambda(x), and lies in this bracket
+        lower = self.lamb(x)/(1-t/self.M)
+        upper = self.lamb(x)/(1-t)
+        if GlobalConstants.THETA_HIGH_PRECISION:
+            # mpmath's tolerance is often unreachable with a float64 load vector,
+            # so the closest root it finds is accepted
+            import mpmath as mp
+            self.theta_dict[(x,t)] = (
+                mp.findroot(lambda theta: theta_eq(theta, t, self.M, self.f(x)),
+                            (mp.mpf(lower), mp.mpf(upper)), 
+                            solver='illinois', verify=False)
+            )
+        else:
+            self.theta_dict[(x,t)] = solve_theta(lower, upper, t, self.M, self.f(x))
             
     def generate_phi(self, x, t):
-        theta = self.theta(x,t)
-        phi = mp.mpf(0)
-        for e in self.instance.graph.edges():
-            phi -= log(theta - self.f(x)[tuple(sorted(e))])
+        theta = float(self.theta(x,t))
+        phi = -float(np.log(theta - self.f(x)).sum())
         phi = phi*t/self.M
         phi += log(theta)
         self.phi_dict[(x,t)] = phi
@@ -154,14 +192,11 @@ class JansenZhangMinMaxer(MulticastPackingSolver):
     
 # Helper Functions
 def theta_eq(theta, t, M, f):
-    retval = mp.mpf(0)
-    
+    # With an mpf theta the terms are mpf, so this also serves mp.findroot
     if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_EXTREME:
-        print("retval: {}".format(type(retval)))
         print("theta: {}: {}".format(type(theta), theta))
     
-    for e in f:
-        retval += theta/(theta - f[tuple(sorted(e))])
+    retval = (theta/(theta - f)).sum()
     retval = t*retval/M - 1
 
     if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_EXTREME:
@@ -172,12 +207,37 @@ def theta_eq(theta, t, M, f):
     return retval
 
 def derivative_theta_eq(theta, t, M, f):
-    retval = mp.mpf(0)
-    for e in f:
-        retval += f[tuple(sorted(e))]/((theta - f[tuple(sorted(e))])*(theta - f[tuple(sorted(e))]))
+    retval = (f/((theta - f)*(theta - f))).sum()
     retval = -t*retval/M
 
     if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_EXTREME:
         print("d_theta_eq = {}".format(retval))
 
-    return retval
\ No newline at end of file
+    return retval
+
+def solve_theta(lower, upper, t, M, f):
+    # Safeguarded Newton's method for the root of theta_eq in [lower, upper].
+    # theta_eq is convex and decreasing above max(f), so from the lower end the
+    # Newton iterates increase monotonically to the root; a step leaving the
+    # bracket is replaced by bisection all the same.
+    theta = lower
+    for k in range(GlobalConstants.THETA_MAX_NEWTON_ITERS):
+        value = theta_eq(theta, t, M, f)
+        if value == 0:
+            break
+        if value > 0:
+            lower = theta
+        else:
+            upper = theta
+
+        derivative = derivative_theta_eq(theta, t, M, f)
+        if derivative < 0:
+            step = -value/derivative
+        else:
+            step = 0
+        if not lower < theta + step < upper:
+            step = (lower + upper)/2 - theta
+        theta += step
+        if abs(step) <= 4*np.finfo(np.float64).eps*theta:
+            break
+    return theta
@@ -1,27 +1,34 @@
 # Solver for the Multicast Packing Problem that uses Simplex, but uses perturbed
 # duals for column generation, rather than those found in the tableau
 
-import mpmath as mp
 import GlobalConstants
 import DebugConstants as db
+from LRUMemo import LRUMemo
 from Solvers.Impls.PureColGenMcpSolver import PureColGenMcpSolver, cost
 from Solvers.Impls.JansenZhangMinMaxer import JansenZhangMinMaxer
 
 class PerturbedColGenMcpSolver(PureColGenMcpSolver, JansenZhangMinMaxer):
-    def __init__(self, instance=None, block_approx=2):
-        super().__init__(instance, block_approx)
-        self.t = mp.mpf(GlobalConstants.TOLERANCE)
-        self.true_p = dict()
+    def __init__(self, instance=None, block_approx=2, deadline=None):
+        super().__init__(instance, block_approx, deadline=deadline)
+        self.t = float(GlobalConstants.TOLERANCE)
+        self.true_p = LRUMemo(GlobalConstants.MEMO_CAPACITY)
         
+    def pricing_filter(self, x):
+        # Columns are judged by the true duals, not the perturbed prices
+        return self.true_p[(x,self.t)], self.q(x)
+    
     def perform_checks_and_updates(self, x):
         t = self.t
         if sum([cost(self.new_trees[i], self.true_p[(x,t)]) 
                 for i in range(self.instance.num_requests)]) >= self.lamb(x):
             self.stop_flag |= GlobalConstants.STOP_DUALITYMATCH
             
-        if all([cost(self.new_trees[i], self.true_p[(x,t)]) - self.q(x)[i] >= 0
-                for i in range(self.instance.num_requests)]):
-            self.stop_flag |= GlobalConstants.STOP_FLAG_REDCOST
+        # Same tolerance as the check under the true duals in the parent
+        if self.column_generator.round_complete:
+            totalNewCost = sum([cost(self.new_trees[i], self.true_p[(x,t)]) for i in range(self.instance.num_requests)])
+            if all([cost(self.new_trees[i], self.true_p[(x,t)]) - self.q(x)[i] >= -self.tol * totalNewCost / self.instance.num_requests
+                    for i in range(self.instance.num_requests)]):
+                self.stop_flag |= GlobalConstants.STOP_FLAG_REDCOST
             
         super().perform_checks_and_updates(x)
         
@@ -40,10 +47,10 @@ class PerturbedColGenMcpSolver(PureColGenMcpSolver, JansenZhangMinMaxer):
         print("phi_t(x): {}".format(self.phi(x,t)))
         print("tolerance: {}".format(self.toleranceFunction()))
         if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_2:
-            for e in self.instance.graph.edges():
-                e = tuple(sorted(e))
-                if self.p(x)[e] > 0.001:
-                    print("p_{} = {}".format(e, self.p(x)[e]))
+            p = self.p(x)
+            for e_id, e in enumerate(self.instance.edges):
+                if p[e_id] > 0.001:
+                    print("p_{} = {}".format(e, p[e_id]))
             for i in range(self.instance.num_requests):
                 print("ReducedCost_{} = {}".format(i,
                 cost(self.new_trees[i], self.true_p[(x,t)]) - self.q(x)[i]))
@@ -2,16 +2,23 @@
 
 import gurobipy as gp
 import networkx as nx
+import numpy as np
 
 import GlobalConstants
 from FrozenDict import FrozenDict
 from Solvers.MulticastPackingSolver import MulticastPackingSolver, cost
 
 class PureColGenMcpSolver(MulticastPackingSolver):
-    def __init__(self, instance=None, block_approx=2):
-        super().__init__(instance, block_approx)
+    def __init__(self, instance=None, block_approx=2, deadline=None):
+        super().__init__(instance, block_approx, deadline=deadline)
     def get_next_solution(self):
-        self.reduced_LP.optimize()
+        self.deadline.limit(self.reduced_LP)
+        with self.telemetry.phase("master_lp"):
+            self.reduced_LP.optimize()
+        if self.reduced_LP.Status == gp.GRB.TIME_LIMIT:
+            return None
+        if self.checkpoint_due(self.iteration + 1):
+            self.record_basis()
         x = [dict() for i in range(self.instance.num_requests)]
         for i in range(self.instance.num_requests):
             for T in self.column_generator.Gurobi_variables[i]:
@@ -21,26 +28,39 @@ class PureColGenMcpSolver(MulticastPackingSolver):
             x[i] = FrozenDict(x[i])
         
         x = tuple(x)
-        self.generate_lamb(x)
-        self.generate_fVal(x)
-        self.generate_p(x)
-        self.generate_q(x)
+        with self.telemetry.phase("duals"):
+            self.generate_lamb(x)
+            self.generate_fVal(x)
+            self.generate_p(x)
+            self.generate_q(x)
+        # Must come after all solution attributes of the LP have been read
+        self.column_generator.age_columns()
         
         return x
     
+    def pricing_filter(self, x):
+        return self.p(x), self.q(x)
+    
     def perform_checks_and_updates(self, x):
         # This first check is broken
         if sum([cost(self.new_trees[i], self.p(x)) 
                 for i in range(self.instance.num_requests)]) >= self.lamb(x):
             self.stop_flag |= GlobalConstants.STOP_DUALITYMATCH
             
-        totalNewCost = sum([cost(self.new_trees[i], self.p(x)) for i in range(self.instance.num_requests)])
-        if all([cost(self.new_trees[i], self.p(x)) - self.q(x)[i] >= -self.tol * totalNewCost / self.instance.num_requests
-                for i in range(self.instance.num_requests)]):
-            self.stop_flag |= GlobalConstants.STOP_FLAG_REDCOST
+        # Only a round that priced every request says anything about optimality
+        if self.column_generator.round_complete:
+            totalNewCost = sum([cost(self.new_trees[i], self.p(x)) for i in range(self.instance.num_requests)])
+            if all([cost(self.new_trees[i], self.p(x)) - self.q(x)[i] >= -self.tol * totalNewCost / self.instance.num_requests
+                    for i in range(self.instance.num_requests)]):
+                self.stop_flag |= GlobalConstants.STOP_FLAG_REDCOST
             
-        if self.toleranceFunction() <= self.tol/(2+self.tol):
-            self.stop_flag |= GlobalConstants.STOP_FLAG_TOL_MET
+            # A complete round that added no column leaves the reduced LP, and
+            # so every later iteration, unchanged
+            if self.column_generator.columns_added == 0:
+                self.stop_flag |= GlobalConstants.STOP_FLAG_REDCOST
+                
+            if self.toleranceFunction() <= self.tol/(2+self.tol):
+                self.stop_flag |= GlobalConstants.STOP_FLAG_TOL_MET
                 
         if self.iteration >= GlobalConstants.MAX_ITERS:
             self.stop_flag |= GlobalConstants.STOP_FLAG_MAXITER
@@ -50,30 +70,20 @@ class PureColGenMcpSolver(MulticastPackingSolver):
         # Doesn't work if x is not current LP solution
     
     def generate_fVal(self, x):
-        self.fVal[x] = dict()
-        for e in self.instance.graph.edges():
-            self.fVal[x][tuple(sorted(e))] = (
-                self.lamb(x) + self.reduced_LP.getConstrByName(
-                    "{} congestion".format(sorted(e))).getAttr(gp.GRB.Attr.Slack) 
-                # Note: Gurobi signs their slacks stupidly
-            )
+        self.fVal[x] = self.lamb(x) + np.array(
+            self.reduced_LP.getAttr(gp.GRB.Attr.Slack, self.congestion_constrs))
+            # Note: Gurobi signs their slacks stupidly
         
     def generate_p(self, x, t=None):
         if not t:
             t = self.t
-        self.price[(x,t)] = dict()
-        
-        for e in self.instance.graph.edges():
-            self.price[(x,t)][tuple(sorted(e))] = max( # Dual sometimes small negative value due to numerical issues. Round these up to 0
-                self.reduced_LP.getConstrByName(
-                "{} congestion".format(sorted(e))).getAttr(gp.GRB.Attr.Pi),
-                0
-            )
+        self.price[(x,t)] = np.maximum( # Dual sometimes small negative value due to numerical issues. Round these up to 0
+            np.array(self.reduced_LP.getAttr(gp.GRB.Attr.Pi, self.congestion_constrs)),
+            0
+        )
             
     def generate_q(self, x, t=None):
         if not t:
             t = self.t
-        self.multicast_costs[(x,t)] = [None] * len(self.instance.requests)
-        for i in range(self.instance.num_requests):
-            self.multicast_costs[(x,t)][i] = self.reduced_LP.getConstrByName(
-                "Tree Selection for {}".format(i)).getAttr(gp.GRB.Attr.Pi)
\ No newline at end of file
+        self.multicast_costs[(x,t)] = np.array(
+            self.reduced_LP.getAttr(gp.GRB.Attr.Pi, self.selection_constrs))
\ No newline at end of file
@@ -0,0 +1,81 @@
+# Solver for the Multicast Packing Problem that uses Simplex, but prices with
+# duals stabilized around the best duals found so far
+
+import numpy as np
+
+import GlobalConstants
+from Solvers.Impls.PureColGenMcpSolver import PureColGenMcpSolver, cost
+
+class StabilizedColGenMcpSolver(PureColGenMcpSolver):
+    def __init__(self, instance=None, block_approx=2, deadline=None):
+        super().__init__(instance, block_approx, deadline=deadline)
+        self.stabilization = GlobalConstants.STABILIZATION
+        self.alpha = GlobalConstants.WENTGES_ALPHA
+        self.box_width = GlobalConstants.BOXSTEP_WIDTH
+        # The stability center is the duals with the best Lagrangian value seen
+        self.center = None
+        self.center_value = -np.inf
+        # Whether the last round priced with the raw duals, and how often
+        # stabilized prices failed to give an improving column
+        self.priced_raw = True
+        self.num_mispricings = 0
+
+    def stabilized_prices(self, p):
+        if self.center is None:
+            return p
+        if self.stabilization == GlobalConstants.STABILIZATION_BOXSTEP:
+            return np.clip(p, self.center - self.box_width, self.center + self.box_width)
+        return self.alpha*self.center + (1 - self.alpha)*p
+
+    def generate_new_trees(self, x, prices, pricing_filter):
+        # Columns are still judged by the raw duals, so a round that adds none
+        # under the stabilized prices is a mispricing and is priced again raw
+        generator = self.column_generator
+        stabilized = self.stabilized_prices(prices)
+        self.priced_raw = self.center is None or np.array_equal(stabilized, prices)
+        new_trees = generator.generate_new_trees(stabilized, *pricing_filter)
+        if not self.priced_raw and generator.columns_added == 0 and not self.deadline.expired():
+            self.num_mispricings += 1
+            self.update_center(stabilized, new_trees)
+            self.update_lower_bound()
+            self.priced_raw = True
+            stabilized = prices
+            new_trees = generator.generate_new_trees(prices, *pricing_filter)
+        self.update_center(stabilized, new_trees)
+        return new_trees
+
+    def update_center(self, prices, new_trees):
+        # Each request's tree is its cheapest found under prices, so this is the
+        # Lagrangian value of prices, up to the pricing approximation
+        value = sum(cost(T, prices) for T in new_trees) / max(prices.sum(), np.finfo(np.float64).tiny)
+        if value > self.center_value:
+            self.center = prices.copy()
+            self.center_value = value
+
+    def perform_checks_and_updates(self, x):
+        # Trees priced under stabilized duals say nothing about the optimality
+        # of the raw ones
+        if self.priced_raw:
+            super().perform_checks_and_updates(x)
+        elif self.iteration >= GlobalConstants.MAX_ITERS:
+            self.stop_flag |= GlobalConstants.STOP_FLAG_MAXITER
+
+    def record_iteration(self, x):
+        super().record_iteration(x)
+        self.telemetry.update(mispricings=self.num_mispricings, center_value=float(self.center_value))
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        if self.center is not None:
+            state.update(center=self.center, center_value=self.center_value)
+        state.update(priced_raw=self.priced_raw, num_mispricings=self.num_mispricings)
+        return state
+
+    def restore_state(self, state):
+        retval = super().restore_state(state)
+        if "center" in state:
+            self.center = state["center"]
+            self.center_value = float(state["center_value"])
+        self.priced_raw = bool(state["priced_raw"])
+        self.num_mispricings = int(state["num_mispricings"])
+        return retval
@@ -4,14 +4,32 @@
 
 import GlobalConstants
 from Solvers.Impls.PureColGenMcpSolver import PureColGenMcpSolver, cost
-from ColumnGenerators.Impls.ExactMulticastPackingColumnGeneratorIP import ExactMulticastPackingColumnGeneratorIP
+from Solvers.MulticastPackingSolver import exact_column_generator
 
 class WarmStartColGenMcpSolver(PureColGenMcpSolver):
-    def __init__(self, instance=None, block_approx=2):
-        super().__init__(instance, 2)
+    def __init__(self, instance=None, block_approx=2, deadline=None):
+        super().__init__(instance, 2, deadline=deadline)
         self.transition_iteration = None
         self.first_stop_flag = 0b00
         
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state.update(
+            transition_iteration=-1 if self.transition_iteration is None else self.transition_iteration,
+            first_stop_flag=self.first_stop_flag)
+        return state
+    
+    def restore_state(self, state):
+        # Columns generated after the switch are exact, so switch before restoring them
+        if state["transition_iteration"] >= 0:
+            exact_generator = exact_column_generator(
+                self.instance, self.reduced_LP, self.congestion_constrs, self.selection_constrs)
+            exact_generator.take_columns(self.column_generator)
+            self.column_generator = exact_generator
+            self.transition_iteration = int(state["transition_iteration"])
+            self.first_stop_flag = int(state["first_stop_flag"])
+        return super().restore_state(state)
+        
     def perform_checks_and_updates(self, x):
         t = self.t
         super().perform_checks_and_updates(x)
@@ -19,7 +37,10 @@ class WarmStartColGenMcpSolver(PureColGenMcpSolver):
         # and that we haven't already transitioned to the exact column generation algorithm, 
         if (self.stop_flag & ~self.first_stop_flag):
             # Channge the column generation algorithm
-            self.column_generator = ExactMulticastPackingColumnGeneratorIP(self.instance, self.reduced_LP)
+            exact_generator = exact_column_generator(
+                self.instance, self.reduced_LP, self.congestion_constrs, self.selection_constrs)
+            exact_generator.take_columns(self.column_generator)
+            self.column_generator = exact_generator
             # Record the iteration and stop flag
             self.transition_iteration = self.iteration
             self.first_stop_flag = self.stop_flag
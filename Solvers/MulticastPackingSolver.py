@@ -2,55 +2,81 @@
 
 from abc import ABC, abstractmethod
 from math import log
+import os
 
 import gurobipy as gp
 import networkx as nx
-import mpmath as mp
-import matplotlib.pyplot as plt
+import numpy as np
 
 import GlobalConstants
 import DebugConstants as db
-from MulticastPackingInstance import MulticastPackingInstance
+from Deadline import Deadline
+from FrozenDict import FrozenDict
+from GurobiEnv import shared_env
+from LRUMemo import LRUMemo
+from Telemetry import Telemetry
+from MulticastPackingInstance import MulticastPackingInstance, EDGE_ID, edge_ids
 from ColumnGenerators.Impls.Approx2MulticastPackingColumnGenerator import Approx2MulticastPackingColumnGenerator
 from ColumnGenerators.Impls.ExactMulticastPackingColumnGeneratorIP import ExactMulticastPackingColumnGeneratorIP
+from ColumnGenerators.Impls.ExactMulticastPackingColumnGeneratorSCF import ExactMulticastPackingColumnGeneratorSCF
 from ColumnGenerators.Impls.ExactMcpWithDelayColumnGenerator import ExactMcpWithDelayColumnGenerator
 
 class MulticastPackingSolver(ABC):
     
     # Constructor
-    def __init__(self, instance=None, block_approx=2):
+    def __init__(self, instance=None, block_approx=2, deadline=None):
         # Attributes related to problem instance
         if instance is None:
             instance = MulticastPackingInstance(NUM_MULTICAST_REQUESTS, MAX_MULTICAST_SIZE)
         self.instance = instance
-        self.reduced_LP = create_LP(self.instance.graph, self.instance.requests)
+        self.block_approx = block_approx
+        self.reduced_LP, self.congestion_constrs, self.selection_constrs = create_LP(
+            self.instance.graph, self.instance.requests)
+        lp_handles = (self.instance, self.reduced_LP, self.congestion_constrs, self.selection_constrs)
         
         # Attributes related to how this solver generates columns and solutions
         if block_approx == "Delay":
-            block_solver = ExactMcpWithDelayColumnGenerator(self.instance, self.reduced_LP)
+            block_solver = ExactMcpWithDelayColumnGenerator(*lp_handles)
         elif block_approx == 1:
-            block_solver = ExactMulticastPackingColumnGeneratorIP(self.instance, self.reduced_LP)
+            block_solver = exact_column_generator(*lp_handles)
         elif block_approx >= 2:
-            block_solver = Approx2MulticastPackingColumnGenerator(self.instance, self.reduced_LP)
+            block_solver = Approx2MulticastPackingColumnGenerator(*lp_handles)
         self.column_generator = block_solver
         
         # Attributes that track things
         self.tol = GlobalConstants.TOLERANCE
+        self.gap_tol = GlobalConstants.GAP_TOLERANCE
+        # Best Lagrangian lower bound on the optimal lambda seen so far
+        self.lower_bound = 0.0
         self.t = None
         self.stop_flag = 0b0
         self.iteration = -1
         self.solution = list()
-        self.objVal = dict()
-        self.fVal = dict()
-        self.price = dict()
-        self.multicast_costs = dict()
+        self.objVal = LRUMemo(GlobalConstants.MEMO_CAPACITY)
+        self.fVal = LRUMemo(GlobalConstants.MEMO_CAPACITY)
+        self.price = LRUMemo(GlobalConstants.MEMO_CAPACITY)
+        self.multicast_costs = LRUMemo(GlobalConstants.MEMO_CAPACITY)
+        # The deadline, if any, already bounds the first pricing round
+        self.set_deadline(Deadline() if deadline is None else deadline)
+        self.telemetry = Telemetry(GlobalConstants.TELEMETRY_SINK)
+        self.column_generator.telemetry = self.telemetry
         self.new_trees = self.column_generator.generate_new_trees()
+        self.update_lower_bound()
+        # Records start with the first iteration
+        self.telemetry.record.clear()
+        
+        # Checkpoints are written every checkpoint_interval iterations once
+        # checkpoint_path is set; basis is the LP basis they warm start from
+        self.checkpoint_path = None
+        self.checkpoint_interval = GlobalConstants.CHECKPOINT_INTERVAL
+        self.basis = None
         
         if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_EXTREME:
             print(reduced_LP.getA().toarray())
             print(reduced_LP.getAttr("RHS"))
             
         if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_FULL:
+            import matplotlib.pyplot as plt
             G = self.instance.graph
             pos = self.instance.pos
             for i in range(self.instance.num_requests):
@@ -87,6 +113,34 @@ class MulticastPackingSolver(ABC):
     def generate_q(self, x, t):
         pass
     
+    def set_deadline(self, deadline):
+        # Every later solve, here and in the column generator, ends by the deadline
+        self.deadline = deadline
+        self.column_generator.deadline = deadline
+    
+    def set_telemetry(self, telemetry):
+        self.telemetry = telemetry
+        self.column_generator.telemetry = telemetry
+    
+    def pricing_filter(self, x):
+        # Duals and multicast costs that decide which priced trees improve the
+        # reduced LP; None adds every priced tree
+        return None, None
+    
+    def generate_new_trees(self, x, prices, pricing_filter):
+        # One pricing round at prices, usually p(x)
+        return self.column_generator.generate_new_trees(prices, *pricing_filter)
+    
+    def update_lower_bound(self):
+        # Any prices give a bound, so the best of them all is kept
+        bound = self.column_generator.round_bound
+        if bound > self.lower_bound:
+            self.lower_bound = bound
+    
+    def gap(self, x):
+        # Relative gap between lambda(x) and the best lower bound
+        return (self.lamb(x) - self.lower_bound) / self.lamb(x)
+    
     # Methods for accessing values of functions needed by the solver
     
     def lamb(self, x):
@@ -122,37 +176,53 @@ class MulticastPackingSolver(ABC):
     def Phi(self, theta, x, t=None):
         return 
     
-    def toleranceFunction(self):
-        x = self.solution[self.iteration]
-        f_prime = dict()
-        for e in self.instance.graph.edges():
-            f_prime[tuple(sorted(e))] = mp.mpf(0)
+    def new_tree_load(self):
+        # Number of new trees using each edge, as counted by the pricing round
+        # that produced them
+        if self.column_generator.new_trees is not self.new_trees:
+            self.column_generator.new_trees = self.new_trees
+            self.column_generator.new_tree_load = np.zeros(self.instance.num_edges)
             for i in range(self.instance.num_requests):
-                if self.new_trees[i].has_edge(*e):
-                    f_prime[tuple(sorted(e))] += 1
+                self.column_generator.new_tree_load[edge_ids(self.new_trees[i])] += 1
+        return self.column_generator.new_tree_load
     
-        pf = dict_innerProd(self.p(x, self.t), self.f(x))
-        pf_prime = dict_innerProd(self.p(x, self.t), f_prime)
+    def toleranceFunction(self):
+        x = self.solution[self.iteration]
+        p = self.p(x, self.t)
+        pf = p @ self.f(x)
+        pf_prime = p @ self.new_tree_load()
         return (pf-pf_prime)/(pf+pf_prime)
     
+    def memo_stats(self):
+        # Hits and misses of each solution-keyed memo of this solver
+        return {name: (memo.hits, memo.misses) for name, memo in vars(self).items()
+                if isinstance(memo, LRUMemo)}
+    
     # Method for printing debug info
     def print_info(self, x, t):
         print(self.iteration)
         print("{:05b}".format(self.stop_flag))
         print("lambda(x): {}".format(self.lamb(x)))
+        print("lower bound: {} (gap {})".format(self.lower_bound, self.gap(x)))
         print("phi_t(x): {}".format(self.phi(x,t)))
         print("tolerance: {}".format(self.toleranceFunction()))
+        if self.column_generator.num_solves:
+            print("pricing solves ended early: {} of {}".format(
+                self.column_generator.num_early_stops, self.column_generator.num_solves))
         if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_THEORY_2:
-            for e in self.instance.graph.edges():
-                e = tuple(sorted(e))
-                if self.p(x)[e] > 0.001:
-                    print("p_{} = {}".format(e, self.p(x)[e]))
+            for name, (hits, misses) in self.memo_stats().items():
+                print("{} memo: {} hits, {} misses".format(name, hits, misses))
+            p = self.p(x)
+            for e_id, e in enumerate(self.instance.edges):
+                if p[e_id] > 0.001:
+                    print("p_{} = {}".format(e, p[e_id]))
             for i in range(self.instance.num_requests):
                 print("ReducedCost_{} = {}".format(i,
                 cost(self.new_trees[i], self.p(x)) - self.q(x)[i]))
                 print("NewCost_{} = {}".format(i,
                 cost(self.new_trees[i], self.p(x))))
         if db.DEBUG_LEVEL >= db.DEBUG_LEVEL_FULL:
+            import matplotlib.pyplot as plt
             G = self.instance.graph
             pos = self.instance.pos
             for i in range(self.instance.num_requests):
@@ -161,15 +231,24 @@ class MulticastPackingSolver(ABC):
                 plt.title("Tree {} for iteration {}".format(i, self.iteration))
                 nx.draw_networkx(G, pos)
                 nx.draw_networkx_edges(G, pos, edgelist=tree.edges(), width=5, edge_color="y", style="dashed")
-                nx.draw_networkx_edge_labels(tree, pos, self.p(x))
+                nx.draw_networkx_edge_labels(tree, pos, self.instance.edge_dict(self.p(x)))
                 #print(tree.edges())
             plt.show()
         print("")
     
     # Main Function
     def perform_iteration(self):
+        # Once the deadline passes the solver stops, keeping its last solution
         t = self.t
-        x = self.get_next_solution()
+        if self.deadline.expired():
+            self.stop_flag |= GlobalConstants.STOP_FLAG_TIMEOUT
+            return
+        with self.telemetry.phase("solution"):
+            x = self.get_next_solution()
+        if x is None:
+            self.stop_flag |= GlobalConstants.STOP_FLAG_TIMEOUT
+            self.telemetry.emit()
+            return
         self.iteration += 1
         if db.DEBUG_LEVEL > db.DEBUG_LEVEL_FULL:
             print("Iteration {}: num trees = {}, num Gurobi Vars = {}".format(
@@ -178,8 +257,24 @@ class MulticastPackingSolver(ABC):
                 sum(len(self.column_generator.Gurobi_variables[i]) for i in range(self.instance.num_requests)),
             ))
         self.solution.append(x)
-        self.new_trees = self.column_generator.generate_new_trees(self.p(x, t))
-        self.perform_checks_and_updates(x)
+        with self.telemetry.phase("prices"):
+            prices = self.p(x, t)
+            pricing_filter = self.pricing_filter(x)
+        with self.telemetry.phase("pricing"):
+            self.new_trees = self.generate_new_trees(x, prices, pricing_filter)
+        self.update_lower_bound()
+        # Trees from a round cut short are no evidence of optimality
+        if self.deadline.expired():
+            self.stop_flag |= GlobalConstants.STOP_FLAG_TIMEOUT
+        else:
+            with self.telemetry.phase("checks"):
+                self.perform_checks_and_updates(x)
+                # Unlike the other checks this one is proof that x is near optimal
+                if self.gap(x) <= self.gap_tol:
+                    self.stop_flag |= GlobalConstants.STOP_FLAG_GAP
+        if self.telemetry.enabled:
+            self.record_iteration(x)
+            self.telemetry.emit()
         
         if (
             ((db.DEBUG_LEVEL > db.DEBUG_LEVEL_THEORY_0) and
@@ -188,31 +283,191 @@ class MulticastPackingSolver(ABC):
         ):
             self.print_info(x, t)
         
+        if self.checkpoint_due(self.iteration):
+            self.checkpoint(self.checkpoint_path)
+    
+    def record_iteration(self, x):
+        # Counters of the iteration that just finished, for telemetry
+        fields = dict(
+            solver=type(self).__name__,
+            iteration=self.iteration,
+            stop_flag=self.stop_flag,
+            lamb=float(self.lamb(x)),
+            lower_bound=float(self.lower_bound),
+            gap=float(self.gap(x)),
+            tolerance=float(self.toleranceFunction()),
+            lp_vars=self.reduced_LP.NumVars,
+            lp_constrs=self.reduced_LP.NumConstrs)
+        if self.reduced_LP.Status != gp.GRB.LOADED:
+            fields.update(lp_iterations=self.reduced_LP.IterCount, lp_work=self.reduced_LP.Work)
+        self.telemetry.update(**fields)
+    
+    # Checkpoints
+    def checkpoint_due(self, iteration):
+        return (self.checkpoint_path is not None and self.checkpoint_interval > 0 
+                and iteration % self.checkpoint_interval == 0)
+    
+    def record_basis(self):
+        # Must be called right after the reduced LP is solved, as adding columns
+        # discards its basis
+        if self.reduced_LP.IsMIP or self.reduced_LP.Status != gp.GRB.OPTIMAL:
+            self.basis = None
+            return
+        # Columns may be added or removed before the checkpoint, so their basis
+        # statuses are kept by pool signature rather than position or variable
+        pool = self.column_generator.column_pool
+        vbasis = self.reduced_LP.getAttr(gp.GRB.Attr.VBasis,
+                                         [self.reduced_LP.getVarByName("lambda")] + pool.variables)
+        self.basis = (
+            vbasis[0],
+            dict(zip(pool.signatures, vbasis[1:])),
+            np.array(self.reduced_LP.getAttr(gp.GRB.Attr.CBasis, self.congestion_constrs + self.selection_constrs)))
+    
+    def checkpoint(self, path):
+        # Written to a temporary file first so a kill never leaves a partial checkpoint
+        state = self.checkpoint_state()
+        with open(path + ".tmp", 'wb') as checkpointFile:
+            np.savez_compressed(checkpointFile, **state)
+        os.replace(path + ".tmp", path)
+    
+    def checkpoint_state(self):
+        # Arrays that, together with restore_state, let a new solver carry on from here
+        pool = self.column_generator.column_pool
+        generator = self.column_generator
+        state = self.instance.arrays()
+        state.update(
+            solver=type(self).__name__,
+            block_approx=str(self.block_approx),
+            iteration=self.iteration,
+            stop_flag=self.stop_flag,
+            lower_bound=self.lower_bound,
+            next_request=generator.next_request,
+            num_solves=generator.num_solves,
+            num_early_stops=generator.num_early_stops,
+        )
+        state.update(pool.state())
+        state.update(trees_state("new_trees", self.new_trees))
+        if self.iteration >= 0:
+            # Every tree of a solution is a pool column
+            x = self.solution[self.iteration]
+            state.update(
+                solution_columns=np.array([pool.column_of[T] for i in range(len(x)) for T in x[i]], dtype=np.intp),
+                solution_weights=np.array([weight for i in range(len(x)) for weight in x[i].values()]))
+            # Values of the solution, which may no longer be recoverable from the reduced LP
+            state.update(
+                lamb=self.lamb(x),
+                load=self.f(x),
+                prices=self.p(x, self.t),
+                multicast_costs=self.q(x, self.t))
+        if self.basis is not None:
+            # In pool order, as restore_state reads it. Columns added since the
+            # basis was recorded are nonbasic at zero.
+            lambda_basis, column_basis, cbasis = self.basis
+            state.update(
+                vbasis=np.array([lambda_basis] + [column_basis.get(sig, gp.GRB.NONBASIC_LOWER)
+                                                  for sig in pool.signatures]),
+                cbasis=cbasis)
+        return state
+    
+    def restore_state(self, state):
+        # Adds the checkpoint's columns to the pool and reduced LP, then returns the
+        # pool column of each checkpointed column
+        generator = self.column_generator
+        pool = generator.column_pool
+        
+        # The instance may number its edges differently from the checkpointed one
+        edge_map = np.array([self.instance.edge_index[tuple(e)] for e in state["edges"].tolist()],
+                            dtype=np.intp)
+        state["new_trees_indices"] = edge_map[state["new_trees_indices"]]
+        for name in ["load", "prices", "center", "cbasis"]:
+            if name in state:
+                values = state[name].copy()
+                values[edge_map] = state[name][:len(edge_map)]
+                state[name] = values
+        
+        self.iteration = int(state["iteration"])
+        self.stop_flag = int(state["stop_flag"])
+        self.lower_bound = float(state["lower_bound"])
+        generator.next_request = int(state["next_request"])
+        generator.num_solves = int(state["num_solves"])
+        generator.num_early_stops = int(state["num_early_stops"])
+        
+        columns = pool.restore(state, lambda i, ids: generator.add_column(i, self.tree_of(ids), ids), edge_map)
+        self.reduced_LP.update()
+        
+        if "vbasis" in state:
+            # Columns the checkpoint doesn't know start nonbasic at zero
+            variables = [self.reduced_LP.getVarByName("lambda")] + pool.variables
+            vbasis = np.full(len(variables), gp.GRB.NONBASIC_LOWER)
+            vbasis[0] = state["vbasis"][0]
+            vbasis[columns + 1] = state["vbasis"][1:]
+            self.reduced_LP.setAttr(gp.GRB.Attr.VBasis, variables, vbasis.tolist())
+            self.reduced_LP.setAttr(gp.GRB.Attr.CBasis, self.congestion_constrs + self.selection_constrs,
+                                    state["cbasis"].tolist())
+        
+        # New trees that are pool columns must be the pool's own trees
+        indptr, indices = state["new_trees_indptr"], state["new_trees_indices"]
+        self.new_trees = list()
+        for i in range(self.instance.num_requests):
+            ids = indices[indptr[i]:indptr[i + 1]]
+            col = pool.find(i, ids)
+            self.new_trees.append(self.tree_of(ids) if col is None else pool.trees[col])
+        
+        if self.iteration >= 0:
+            x = [dict() for i in range(self.instance.num_requests)]
+            request_ids = pool.request_ids()
+            for col, weight in zip(columns[state["solution_columns"]], state["solution_weights"]):
+                x[request_ids[col]][pool.trees[col]] = weight
+            # Earlier solutions are not kept
+            self.solution = [None]*self.iteration + [tuple(FrozenDict(x_i) for x_i in x)]
+            self.restore_values(self.solution[self.iteration], state)
+        return columns
+    
+    def restore_values(self, x, state):
+        self.objVal[x] = float(state["lamb"])
+        self.fVal[x] = state["load"]
+        self.price[(x,self.t)] = state["prices"]
+        self.multicast_costs[(x,self.t)] = state["multicast_costs"]
+    
+    def tree_of(self, ids):
+        return self.instance.graph.edge_subgraph(self.instance.edges[e_id] for e_id in ids)
+        
         
 # Helper Functions
-def dict_innerProd(x, y):
-    assert x.keys() == y.keys()
-    return sum(x[key]*y[key] for key in x.keys())
+def exact_column_generator(instance, reduced_LP, congestion_constrs, selection_constrs):
+    # Exact pricing in the formulation chosen by GlobalConstants.EXACT_PRICING_FORMULATION
+    if GlobalConstants.EXACT_PRICING_FORMULATION == GlobalConstants.SCF_FORMULATION:
+        generator_class = ExactMulticastPackingColumnGeneratorSCF
+    else:
+        generator_class = ExactMulticastPackingColumnGeneratorIP
+    return generator_class(instance, reduced_LP, congestion_constrs, selection_constrs)
 
 def create_LP(G, multicast_requests):
+    # Returns the model along with its congestion constraints in edge-id order
+    # and its tree selection constraints in request order
     nx.set_edge_attributes(G, 1, "weight")
-    reduced_LP = gp.Model("Multicast Packing Model - Reduced")
+    reduced_LP = gp.Model("Multicast Packing Model - Reduced", env=shared_env())
     congestion = reduced_LP.addVar(name="lambda")
     reduced_LP.setObjective(congestion, gp.GRB.MINIMIZE)
     reduced_LP.update()
     # Packing Constraints
-    for e in G.edges():
-        reduced_LP.addConstr(congestion >= 0, name="{} congestion".format(sorted(e)))
+    congestion_constrs = [None] * G.number_of_edges()
+    for u, v, e_id in G.edges(data=EDGE_ID):
+        congestion_constrs[e_id] = reduced_LP.addConstr(
+            congestion >= 0, name="{} congestion".format(sorted((u, v))))
     # Simplex Constraints
-    for i in range(len(multicast_requests)):
+    selection_constrs = [
         reduced_LP.addConstr(0*congestion == 1, name="Tree Selection for {}".format(i))
+        for i in range(len(multicast_requests))]
     reduced_LP.update()
-    return reduced_LP
+    return reduced_LP, congestion_constrs, selection_constrs
+
+def trees_state(name, trees):
+    # Edge ids of a list of trees in CSR form
+    ids = [edge_ids(T) for T in trees]
+    return {name + "_indptr": np.cumsum([0] + [len(e) for e in ids]),
+            name + "_indices": np.concatenate(ids + [np.zeros(0, dtype=np.intp)])}
 
-# Helper Functions
 def cost(G, prices):
-    original_weights = nx.get_edge_attributes(G, "weight") 
-    nx.set_edge_attributes(G, prices, "weight")
-    retval = sum(nx.get_edge_attributes(G, "weight").values())
-    nx.set_edge_attributes(G, original_weights, "weight")
-    return retval
\ No newline at end of file
+    # prices is an edge-id indexed array
+    return prices[edge_ids(G)].sum()
\ No newline at end of file
@@ -0,0 +1,37 @@
+# Restoring solvers from the checkpoints written by MulticastPackingSolver.checkpoint
+
+import numpy as np
+
+from MulticastPackingInstance import MulticastPackingInstance
+from Solvers.Impls.PureColGenMcpSolver import PureColGenMcpSolver
+from Solvers.Impls.JansenZhangMinMaxer import JansenZhangMinMaxer
+from Solvers.Impls.PerturbedColGenMcpSolver import PerturbedColGenMcpSolver
+from Solvers.Impls.ColGenIPSolver import ColGenIPSolver
+from Solvers.Impls.WarmStartColGenMcpSolver import WarmStartColGenMcpSolver
+from Solvers.Impls.WarmStartPerturbedDualColGenMcpSolver import WarmStartPerturbedDualColGenMcpSolver
+from Solvers.Impls.StabilizedColGenMcpSolver import StabilizedColGenMcpSolver
+
+SOLVER_CLASSES = {cls.__name__: cls for cls in [
+    PureColGenMcpSolver,
+    JansenZhangMinMaxer,
+    PerturbedColGenMcpSolver,
+    ColGenIPSolver,
+    WarmStartColGenMcpSolver,
+    WarmStartPerturbedDualColGenMcpSolver,
+    StabilizedColGenMcpSolver
+]}
+
+def restore_solver(path, instance=None):
+    # A solver that carries on from the checkpoint at path. The checkpoint holds
+    # its own instance, which is rebuilt unless the original is given.
+    with np.load(path) as checkpointFile:
+        state = dict(checkpointFile)
+    if instance is None:
+        instance = MulticastPackingInstance.from_arrays(state)
+    block_approx = str(state["block_approx"])
+    if block_approx != "Delay":
+        block_approx = int(block_approx)
+    
+    solver = SOLVER_CLASSES[str(state["solver"])](instance=instance, block_approx=block_approx)
+    solver.restore_state(state)
+    return solver
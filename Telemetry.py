@@ -0,0 +1,48 @@
+# Per-iteration timings and counters, streamed as JSON lines
+
+import contextlib
+import json
+import time
+
+class Telemetry:
+    def __init__(self, sink=None):
+        # sink is a path to append to or an open file; None records nothing
+        self.sink = sink
+        self.enabled = sink is not None
+        self.record = dict()
+        self._file = None
+
+    def phase(self, name):
+        # Context adding the time spent inside it to the record's name_secs
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name + "_secs", time.perf_counter() - start)
+
+    def add(self, name, value):
+        self.record[name] = self.record.get(name, 0) + value
+
+    def update(self, **fields):
+        self.record.update(fields)
+
+    def emit(self):
+        # Write the record as one line and start a new one
+        if not self.enabled:
+            return
+        if self._file is None:
+            self._file = open(self.sink, 'a') if isinstance(self.sink, str) else self.sink
+        self._file.write(json.dumps(self.record, default=float) + "\n")
+        self._file.flush()
+        self.record = dict()
+
+    def close(self):
+        if self._file is not None and isinstance(self.sink, str):
+            self._file.close()
+        self._file = None